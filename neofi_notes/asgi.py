@@ -3,6 +3,11 @@ ASGI config for neofi_notes project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The note events stream (/notes/events/) keeps connections open and must be
+served through this application, e.g. ``uvicorn neofi_notes.asgi:application``.
+Set NOTES_ASYNC_VIEWS to serve the core note views with their async versions
+(opt-in, the Procfile deploys the WSGI application).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+from neofi_notes.database import database_config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'notes.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'notes.middleware.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'neofi_notes.urls'
@@ -76,14 +79,19 @@ WSGI_APPLICATION = 'neofi_notes.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+# Configured with the DATABASE_URL environment variable (db.sqlite3 by default), and optionally a
+# read replica with DATABASE_REPLICA_URL, see neofi_notes/database.py for the URLs and connection settings
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(os.environ.get('DATABASE_URL', f'sqlite:///{BASE_DIR / "db.sqlite3"}')),
 }
 
+if os.environ.get('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = database_config(os.environ['DATABASE_REPLICA_URL'])
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'} # tests read the replica from the test primary
+
+DATABASE_ROUTERS = ['notes.routers.PrimaryReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -129,3 +137,191 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'notes.NeofiUser'
+
+# Django REST framework
+# JSON is rendered and parsed with orjson when it is installed (see notes/renderers.py), the
+# browsable API is only enabled in DEBUG
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['notes.renderers.FastJSONRenderer'] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    'DEFAULT_PARSER_CLASSES': ['notes.renderers.FastJSONParser', 'rest_framework.parsers.FormParser', 'rest_framework.parsers.MultiPartParser'],
+}
+
+# Notes app
+# Number of versions between two full snapshots in the delta encoded note history
+
+NOTES_HISTORY_SNAPSHOT_INTERVAL = 50
+
+# Default and maximum page size of the paginated note version history
+
+NOTES_HISTORY_PAGE_SIZE = 100
+
+NOTES_HISTORY_MAX_PAGE_SIZE = 1000
+
+# Number of edits fetched per database round trip when streaming the note version history
+
+NOTES_HISTORY_STREAM_CHUNK_SIZE = 500
+
+# Token -> user cache of notes.authentication.CachedTokenAuthentication
+# CACHE_ALIAS optionally names a cache from CACHES shared by all the processes, through which the
+# invalidations reach every process; without it the entries only live LOCAL_TTL seconds
+
+NOTES_TOKEN_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'LOCAL_TTL': 5,
+    'CACHE_ALIAS': None,
+}
+
+# Number of rows inserted per query by bulk operations
+
+NOTES_BULK_BATCH_SIZE = 1000
+
+# Cache of the ids of the notes shared with every user (notes.access)
+
+NOTES_ACCESS_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+}
+
+# Default and maximum page size of the list of notes
+
+NOTES_LIST_PAGE_SIZE = 50
+
+NOTES_LIST_MAX_PAGE_SIZE = 500
+
+# Maximum number of edits, shares and deletions each returned per call of the change feed
+
+NOTES_CHANGES_PAGE_SIZE = 500
+
+# Publish/subscribe backend of the note events stream and seconds between keep-alives sent to idle clients
+
+NOTES_PUBSUB_BACKEND = 'notes.pubsub.InProcessBroker'
+
+NOTES_EVENTS_HEARTBEAT = 15
+
+# Full-text search engine (dotted path, FTS5 on SQLite and substring matching otherwise when None)
+# and default and maximum page size of the search results
+
+NOTES_SEARCH_ENGINE = None
+
+NOTES_SEARCH_PAGE_SIZE = 20
+
+NOTES_SEARCH_MAX_PAGE_SIZE = 100
+
+# Maximum number of notes created by one bulk creation request
+
+NOTES_BULK_MAX_NOTES = 10000
+
+# Storage of the large texts of the version history (appended text and snapshots of at least
+# MIN_SIZE characters) as compressed, deduplicated blobs. CODEC is 'zlib' or 'zstd' (needs the
+# zstandard package). Existing rows are moved with: python manage.py migrate_note_storage
+
+NOTES_CONTENT_STORAGE = {
+    'ENABLED': False,
+    'CODEC': 'zlib',
+    'MIN_SIZE': 1024,
+}
+
+# Number of times an update of a note (PUT /notes/<id>/) is retried when another append won the race
+
+NOTES_UPDATE_RETRIES = 5
+
+# Seconds the reads of a user are served by the primary database after they wrote, so that they
+# see their own writes despite the replication lag of the replica, and cache holding the times of the writes
+# (must be shared by all the processes, e.g. Redis or Memcached, when there are several)
+
+NOTES_REPLICA_PIN_SECONDS = 5
+
+NOTES_REPLICA_PIN_CACHE = 'default'
+
+# Tuning of the SQLite connections for concurrent writers (see notes/sqlite.py): WAL journal,
+# synchronous NORMAL, milliseconds waited for the write lock, bytes of memory mapped I/O and
+# page cache size (KiB if negative). Run python manage.py sqlite_maintenance --interval 300 to
+# checkpoint the WAL file periodically
+
+NOTES_SQLITE = {
+    'ENABLED': True,
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    'BUSY_TIMEOUT': 5000,
+    'MMAP_SIZE': 268435456,
+    'CACHE_SIZE': -64000,
+}
+
+# Serve the core note views (list, create, retrieve/update/delete, append and version history) with
+# their async versions (notes/async_views.py). Enable it when running under ASGI workers, e.g.
+# gunicorn neofi_notes.asgi:application -k uvicorn.workers.UvicornWorker, and leave it off under WSGI
+
+NOTES_ASYNC_VIEWS = os.environ.get('NOTES_ASYNC_VIEWS', 'false').lower() in ('1', 'true', 'yes')
+
+# Per route latency, query and response size metrics, exposed on /metrics/ in the Prometheus format
+# (see notes/metrics.py). Server-Timing headers are added if SERVER_TIMING is set, requests slower
+# than SLOW_REQUEST_MS are logged with their SQL to the notes.slow_requests logger. /metrics/ is only
+# enabled when NOTES_METRICS_TOKEN is set, and then requires an Authorization: Bearer <TOKEN> header
+# (with DEBUG it is also served without a token)
+
+NOTES_METRICS = {
+    'ENABLED': True,
+    'SERVER_TIMING': DEBUG,
+    'SLOW_REQUEST_MS': 1000,
+    'SLOW_REQUEST_MAX_QUERIES': 50,
+    'TOKEN': os.environ.get('NOTES_METRICS_TOKEN') or None,
+}
+
+# Caches: the default one, and the size bounded (least recently used entries evicted first) one of the
+# note reads. Both are in process, use a shared cache (e.g. Redis) when running several processes
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'notes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'notes',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Cache of the note reads (GET /notes/<id>/, see notes/note_cache.py) in the cache CACHE_ALIAS, for
+# TIMEOUT seconds. VALIDATE (None: when CACHE_ALIAS is in process) reads the current version of a
+# cached note from the database, so the writes of the other processes are seen; it can be turned
+# off when CACHE_ALIAS is shared by all the processes
+
+NOTES_NOTE_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'notes',
+    'TIMEOUT': 60,
+    'VALIDATE': None,
+}
+
+# Number of history entries of a deleted note removed per transaction by purge_deleted_notes
+
+NOTES_PURGE_BATCH_SIZE = 1000
+
+# Background jobs following the writes (search indexing, purge of deleted notes, see notes/jobs.py).
+# Run inline by the requests unless NOTES_JOBS_INLINE=false, then by `manage.py run_notes_worker`.
+# WARM_NOTE_CACHE caches the notes appended to from the worker, enable it with a shared cache only
+
+NOTES_JOBS = {
+    'INLINE': os.environ.get('NOTES_JOBS_INLINE', 'true').lower() in ('1', 'true', 'yes'),
+    'THREADS': 4,
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 10,
+    'WARM_NOTE_CACHE': False,
+}
+
+# Limits of POST /notes/import/: the export is spooled before it is imported (in memory up to
+# SPOOL_MEMORY bytes, then to a temporary file) and rejected over MAX_BYTES (uncompressed) or MAX_RECORDS
+
+NOTES_IMPORT = {
+    'MAX_BYTES': 100 * 1024 * 1024,
+    'MAX_RECORDS': 1000000,
+    'SPOOL_MEMORY': 1024 * 1024,
+}
+
+# Seconds of changes before the cursor returned again by GET /notes/changes/, for the rows committed
+# out of id order by concurrent writers (None: 0 on SQLite, where the writes are serialized, 5 otherwise)
+
+NOTES_CHANGES_RESCAN_SECONDS = None
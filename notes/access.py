@@ -0,0 +1,135 @@
+"""
+Access control for notes: a note is accessible by a user if it is shared with them (NoteShare).
+The owner of a note always has a share of it.
+
+The ids of the notes accessible by a user are cached in process (NOTES_ACCESS_CACHE), so
+repeated reads of the same notes skip the permission query. Accesses are only ever added
+(share_note, note creation) or removed together with the note (delete), so a stale set is
+safe: a missing id falls back to a database check and a removed note is not found anymore.
+"""
+
+import threading
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from notes.cache import LRUCache
+from notes.models import Note, NoteShare
+
+_access_cache = None
+_access_cache_lock = threading.Lock()
+
+
+def get_access_cache():
+    """
+    Returns the in-process user id -> accessible note ids cache, creating it on first use.
+    """
+    global _access_cache
+    if _access_cache is None:
+        with _access_cache_lock:
+            if _access_cache is None:
+                options = {'MAX_SIZE': 10000, 'TTL': 300}
+                options.update(getattr(settings, 'NOTES_ACCESS_CACHE', {}))
+                _access_cache = LRUCache(max_size=options['MAX_SIZE'], ttl=options['TTL'])
+    return _access_cache
+
+
+def accessible_note_ids(user_id):
+    """
+    Returns the set of ids of the notes shared with the user.
+    """
+    access_cache = get_access_cache()
+    note_ids = access_cache.get(user_id)
+    if note_ids is None:
+        note_ids = frozenset(NoteShare.objects.filter(user_id=user_id).values_list('note_id', flat=True))
+        access_cache.set(user_id, note_ids)
+    return note_ids
+
+
+def invalidate_access(*user_ids):
+    """
+    Drop the cached accessible notes of the given users.
+    """
+    access_cache = get_access_cache()
+    for user_id in user_ids:
+        access_cache.delete(user_id)
+
+
+def user_has_access(user, note_id):
+    """
+    Returns True if the note is shared with the user.
+    """
+    if note_id in accessible_note_ids(user.id):
+        return True
+    if NoteShare.objects.filter(note_id=note_id, user=user).exists(): # shared since the accessible notes were cached
+        invalidate_access(user.id)
+        return True
+    return False
+
+
+def get_accessible_note(user, note_id, queryset=None):
+    """
+    Fetch a note and check that it is shared with the user.
+
+    Parameters:
+        - user: user accessing the note.
+        - note_id: id of the note (as given in the url).
+        - queryset: Note queryset to fetch the note from, e.g. to defer the content.
+
+    Returns:
+        - (note, has_access) tuple, note is None if it does not exist.
+    """
+    if queryset is None:
+        queryset = Note.objects.all()
+    try:
+        note_id = int(note_id)
+    except (TypeError, ValueError):
+        return None, False
+
+    if note_id in accessible_note_ids(user.id): # known to be shared, only fetch the note
+        note = queryset.filter(id=note_id).first()
+        return note, note is not None
+
+    # fetch the note and check the share in a single query
+    shared = NoteShare.objects.filter(note_id=OuterRef('pk'), user=user)
+    note = queryset.annotate(is_shared=Exists(shared)).filter(id=note_id).first()
+    if note is None:
+        return None, False
+    if note.is_shared: # shared since the accessible notes were cached
+        invalidate_access(user.id)
+    return note, note.is_shared
+
+
+async def aaccessible_note_ids(user_id):
+    """
+    Async version of accessible_note_ids.
+    """
+    access_cache = get_access_cache()
+    note_ids = access_cache.get(user_id)
+    if note_ids is None:
+        note_ids = frozenset([note_id async for note_id in NoteShare.objects.filter(user_id=user_id).values_list('note_id', flat=True)])
+        access_cache.set(user_id, note_ids)
+    return note_ids
+
+
+async def aget_accessible_note(user, note_id, queryset=None):
+    """
+    Async version of get_accessible_note.
+    """
+    if queryset is None:
+        queryset = Note.objects.all()
+    try:
+        note_id = int(note_id)
+    except (TypeError, ValueError):
+        return None, False
+
+    if note_id in await aaccessible_note_ids(user.id): # known to be shared, only fetch the note
+        note = await queryset.filter(id=note_id).afirst()
+        return note, note is not None
+
+    # fetch the note and check the share in a single query
+    shared = NoteShare.objects.filter(note_id=OuterRef('pk'), user=user)
+    note = await queryset.annotate(is_shared=Exists(shared)).filter(id=note_id).afirst()
+    if note is None:
+        return None, False
+    if note.is_shared: # shared since the accessible notes were cached
+        invalidate_access(user.id)
+    return note, note.is_shared
@@ -1,7 +1,9 @@
 from django.contrib import admin
-from notes.models import NeofiUser, Note, NoteEdit, NoteShare
+from notes.models import ContentBlob, NeofiUser, Note, NoteEdit, NoteShare, NoteTombstone
 
 admin.site.register(NeofiUser)
 admin.site.register(Note)
 admin.site.register(NoteEdit)
 admin.site.register(NoteShare)
+admin.site.register(NoteTombstone)
+admin.site.register(ContentBlob)
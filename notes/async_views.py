@@ -0,0 +1,374 @@
+"""
+Async versions of the core note views (list, create, retrieve/update/delete, append and version
+history), served natively by ASGI workers (e.g. uvicorn) when NOTES_ASYNC_VIEWS is set (see
+notes/urls.py), so that slow clients and long history downloads don't hold a worker thread.
+
+DRF views are sync only, so these are plain Django async views behaving like their DRF
+counterparts in notes.views (same parameters, bodies, headers and status codes): async_api_view
+authenticates the token and parses the request body like api_view does, and hands the methods
+the async views don't implement (HEAD, OPTIONS) to the DRF views. Reads use the async ORM
+(afirst, acreate, async iteration); writes of several rows go through notes.services in a thread,
+as they run in transactions, which the async ORM does not support.
+"""
+
+from functools import wraps
+from io import BytesIO
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, UnsupportedMediaType
+from notes.access import aget_accessible_note, invalidate_access
+from notes.authentication import CachedTokenAuthentication
+from notes.conditional import conditional_response, history_etag, note_etag, set_validators
+from notes.history import EDIT_VALUES, annotate_rows, content_as_of, content_at, edits_after
+from notes.models import Note, NoteEdit, NoteShare
+from notes.note_cache import acache_note, aget_cached_note
+from notes.pagination import InvalidCursor, decode_timestamp_cursor, encode_cursor, get_page_size
+from notes.pubsub import publish_edit
+from notes.renderers import FastJSONParser, dumps
+from notes.routers import replica_reads
+from notes.serializers import NoteAppendSerializer, NoteSerializer, edit_rows_data
+from notes.services import NoteAppendConflict, NoteNotExtended, append_to_note, delete_note, extend_note, index_appends
+from notes import views
+from notes.views import note_list_page, note_list_query, parse_as_of
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def render(data, status_code):
+    """
+    Returns a JSON response rendered like the DRF JSONRenderer.
+    """
+    return HttpResponse(dumps(data), status=status_code, content_type='application/json')
+
+
+def _parse_data(request):
+    """
+    Parse the request body like the DRF parsers (JSON, form and multipart).
+    """
+    if not request.body:
+        return {}
+    if request.content_type == 'application/json':
+        return FastJSONParser().parse(BytesIO(request.body))
+    if request.content_type in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+        return request.POST
+    raise UnsupportedMediaType(request.META.get('CONTENT_TYPE', ''))
+
+
+def _call_sync_view(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    return response.render() # DRF responses are rendered lazily, render them in the thread
+
+
+def _allow_header(sync_view):
+    instance = sync_view.cls(**sync_view.initkwargs)
+    if hasattr(instance, 'get') and not hasattr(instance, 'head'): # like View.setup
+        instance.head = instance.get
+    return ', '.join(instance.allowed_methods)
+
+
+def async_api_view(methods, sync_view):
+    """
+    Decorator of the async views, doing what api_view, CachedTokenAuthentication and
+    IsAuthenticated do for the DRF views: the request gets user, query_params and data attributes.
+
+    The other methods (HEAD, OPTIONS and the methods not allowed) are handled by sync_view, the
+    DRF version of the view, in a thread, so that their responses are the same.
+    """
+    allow = _allow_header(sync_view)
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return await sync_to_async(_call_sync_view)(sync_view, request, *args, **kwargs)
+            authenticator = CachedTokenAuthentication()
+            try:
+                credentials = await sync_to_async(authenticator.authenticate)(request) # the token cache may need the database
+                if credentials is None:
+                    raise NotAuthenticated()
+                request.user = credentials[0]
+                request.query_params = request.GET
+                request.data = _parse_data(request) if request.method not in SAFE_METHODS else {}
+            except APIException as error:
+                response = render({'detail': error.detail}, error.status_code)
+                if error.status_code == status.HTTP_401_UNAUTHORIZED:
+                    response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+            else:
+                response = await view(request, *args, **kwargs)
+            response['Allow'] = allow
+            return response
+        return csrf_exempt(wrapper) # like api_view, the token is not sent automatically by browsers
+    return decorator
+
+
+@async_api_view(['GET'], views.list_notes)
+@replica_reads
+async def list_notes(request):
+    """
+    Async version of notes.views.list_notes.
+    """
+    try:
+        notes, fields, page_size = note_list_query(request)
+    except ValueError as error:
+        return render({'message': str(error)}, status.HTTP_400_BAD_REQUEST)
+    return render(note_list_page([note async for note in notes], fields, page_size), status.HTTP_200_OK)
+
+
+def _record_creation(note, user):
+    edit = NoteEdit.objects.record_edit(note_id=note.id, edited_by=user, offset=0, appended_content=note.content, edited_content=note.content)
+    index_appends([(note.id, note.content)])
+    return edit
+
+
+@async_api_view(['POST'], views.create_notes)
+async def create_notes(request):
+    """
+    Async version of notes.views.create_notes.
+    """
+    serializer = NoteSerializer(data=request.data)
+    if not serializer.is_valid():
+        return render(serializer.errors, status.HTTP_400_BAD_REQUEST)
+    note = await Note.objects.acreate(owner=request.user, **serializer.validated_data)
+    await NoteShare.objects.acreate(note=note, user=request.user)
+    invalidate_access(request.user.id)
+    publish_edit(await sync_to_async(_record_creation)(note, request.user))
+    await acache_note(note.id, note.updated_at, NoteSerializer(note).data)
+    return render({'message': 'Note creation successful.', 'note_id': note.id, 'owner': {'email': request.user.email, 'username': request.user.username}}, status.HTTP_201_CREATED)
+
+
+@async_api_view(['GET', 'PUT', 'DELETE'], views.NoteRetriveUpdate.as_view())
+async def note(request, id):
+    """
+    Async version of notes.views.NoteRetriveUpdate.
+    """
+    if request.method == 'GET':
+        return await retrieve_note(request, id)
+    if request.method == 'PUT':
+        return await update_note(request, id)
+    return await remove_note(request, id)
+
+
+@replica_reads
+async def retrieve_note(request, id):
+    version = request.query_params.get('version')
+    at = request.query_params.get('at')
+    if version is not None or at is not None:
+        return await retrieve_note_as_of(request, id, version, at)
+
+    cached = await aget_cached_note(request.user, id)
+    if cached is not None:
+        updated_at, data = cached
+        etag = note_etag(data['id'], updated_at)
+        not_modified = conditional_response(request, etag, updated_at)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(render(data, status.HTTP_200_OK), etag, updated_at)
+
+    conditional = 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+    note, has_access = await aget_accessible_note(request.user, id, Note.objects.defer('content') if conditional else None) # the content may not be needed
+    if note is None:
+        return render({'message': 'Note does not exist.'}, status.HTTP_404_NOT_FOUND)
+    if not has_access: # check if the note is shared with the logged in user
+        return render({'message': 'You are not authorized to view the note.'}, status.HTTP_401_UNAUTHORIZED)
+
+    etag = note_etag(note.id, note.updated_at)
+    not_modified = conditional_response(request, etag, note.updated_at)
+    if not_modified is not None: # the client has the current version
+        return not_modified
+    if conditional:
+        await note.arefresh_from_db(fields=['content'])
+    data = NoteSerializer(note).data
+    await acache_note(note.id, note.updated_at, data)
+    return set_validators(render(data, status.HTTP_200_OK), etag, note.updated_at)
+
+
+async def retrieve_note_as_of(request, id, version, at):
+    try:
+        version, at = parse_as_of(version, at)
+    except ValueError as error:
+        return render({'message': str(error)}, status.HTTP_400_BAD_REQUEST)
+
+    note, has_access = await aget_accessible_note(request.user, id, Note.objects.defer('content')) # the current content is not needed
+    if note is None:
+        return render({'message': 'Note does not exist.'}, status.HTTP_404_NOT_FOUND)
+    if not has_access: # check if the note is shared with the logged in user
+        return render({'message': 'You are not authorized to view the note.'}, status.HTTP_401_UNAUTHORIZED)
+
+    note.content, edit = await sync_to_async(content_as_of)(note.id, version=version, at=at)
+    if edit is None:
+        return render({'message': 'Note version does not exist.'}, status.HTTP_404_NOT_FOUND)
+    note.updated_at = edit.edit_timestamp
+    return render({**NoteSerializer(note).data, 'version': edit.version}, status.HTTP_200_OK)
+
+
+async def update_note(request, id):
+    note, has_access = await aget_accessible_note(request.user, id, Note.objects.only('id', 'created_at', 'updated_at')) # the content is read when updating
+    if note is None:
+        return render({'message': 'Note does not exist.'}, status.HTTP_404_NOT_FOUND)
+    if not has_access: # check if the note is shared with the logged in user
+        return render({'message': 'You are not authorized to edit the note.'}, status.HTTP_401_UNAUTHORIZED)
+
+    serializer = NoteSerializer(note, data=request.data)
+    if not serializer.is_valid() or not isinstance(request.data.get('content'), str):
+        return render(serializer.errors or {'content': ['Not a valid string.']}, status.HTTP_400_BAD_REQUEST)
+    edited_note = request.data['content']
+
+    precondition = 'HTTP_IF_MATCH' in request.META or 'HTTP_IF_UNMODIFIED_SINCE' in request.META
+    if precondition:
+        failed = conditional_response(request, note_etag(note.id, note.updated_at), note.updated_at)
+        if failed is not None:
+            return failed
+
+    try: # update the version that was read, and record it in the history, atomically
+        updated = await sync_to_async(extend_note)(note.id, request.user, edited_note, expected_updated_at=note.updated_at if precondition else None)
+    except Note.DoesNotExist:
+        return render({'message': 'Note does not exist.'}, status.HTTP_404_NOT_FOUND)
+    except NoteNotExtended: # existing note content cannot be edited, but only appended
+        return render({'message': 'Note update failed.', 'error': 'You can only add the new lines after the existing lines.'}, status.HTTP_403_FORBIDDEN)
+    except NoteAppendConflict:
+        return render(
+            {'message': 'Note update failed.', 'error': 'The note has been modified, fetch it again and retry.'},
+            status.HTTP_412_PRECONDITION_FAILED if precondition else status.HTTP_409_CONFLICT,
+        )
+    note.content, note.updated_at = edited_note, updated['updated_at']
+    await acache_note(note.id, note.updated_at, serializer.data)
+    response = render({'message': 'Note update successful.', 'data': serializer.data}, status.HTTP_200_OK)
+    return set_validators(response, note_etag(note.id, note.updated_at), note.updated_at)
+
+
+async def remove_note(request, id):
+    note, has_access = await aget_accessible_note(request.user, id, Note.objects.only('id'))
+    if note is None:
+        return render({'message': 'Note does not exist.'}, status.HTTP_404_NOT_FOUND)
+    if not has_access: # check if the note is shared with the logged in user
+        return render({'message': 'You are not authorized to delete the note.'}, status.HTTP_401_UNAUTHORIZED)
+    await sync_to_async(delete_note)(note.id) # delete note and related items
+    return render({'message': 'Note deleted'}, status.HTTP_204_NO_CONTENT)
+
+
+@async_api_view(['PATCH'], views.append_note)
+async def append_note(request, id):
+    """
+    Async version of notes.views.append_note.
+    """
+    note, has_access = await aget_accessible_note(request.user, id, Note.objects.only('id', 'updated_at'))
+    if note is None:
+        return render({'message': 'Note does not exist.'}, status.HTTP_404_NOT_FOUND)
+    if not has_access: # check if the note is shared with the logged in user
+        return render({'message': 'You are not authorized to edit the note.'}, status.HTTP_401_UNAUTHORIZED)
+
+    serializer = NoteAppendSerializer(data=request.data)
+    if not serializer.is_valid():
+        return render(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    expected_updated_at = serializer.validated_data.get('updated_at')
+    precondition = 'HTTP_IF_MATCH' in request.META or 'HTTP_IF_UNMODIFIED_SINCE' in request.META
+    if precondition:
+        failed = conditional_response(request, note_etag(note.id, note.updated_at), note.updated_at)
+        if failed is not None:
+            return failed
+        if expected_updated_at is None: # the append must still apply to the version the client has
+            expected_updated_at = note.updated_at
+
+    try:
+        note = await sync_to_async(append_to_note)(
+            note.id,
+            request.user,
+            serializer.validated_data['content'],
+            expected_length=serializer.validated_data.get('expected_length'),
+            expected_updated_at=expected_updated_at,
+        )
+    except NoteAppendConflict:
+        return render(
+            {'message': 'Note append failed.', 'error': 'The note has been modified, fetch it again and retry.'},
+            status.HTTP_412_PRECONDITION_FAILED if precondition else status.HTTP_409_CONFLICT,
+        )
+    response = render({'message': 'Note append successful.', 'data': note}, status.HTTP_200_OK)
+    return set_validators(response, note_etag(note['id'], note['updated_at']), note['updated_at'])
+
+
+@async_api_view(['GET'], views.note_version_history)
+@replica_reads
+async def note_version_history(request, id):
+    """
+    Async version of notes.views.note_version_history, the ndjson stream is sent without holding a thread.
+    """
+    note, has_access = await aget_accessible_note(request.user, id, Note.objects.only('id')) # check if the note is shared with the logged in user
+    if not has_access:
+        return render({'message': 'You are not authorized to view the version history for this note.'}, status.HTTP_401_UNAUTHORIZED)
+
+    # the history only grows, its last edit identifies it
+    last_edit = await NoteEdit.objects.filter(note_id=note.id).order_by('-edit_timestamp', '-id').values('id', 'edit_timestamp').afirst()
+    if last_edit is not None:
+        etag = history_etag(note.id, last_edit['id'])
+        not_modified = conditional_response(request, etag, last_edit['edit_timestamp'])
+        if not_modified is not None: # the client has the current history
+            return not_modified
+    response = await note_version_history_response(request, note.id)
+    if last_edit is not None and response.status_code == status.HTTP_200_OK:
+        set_validators(response, etag, last_edit['edit_timestamp'])
+    return response
+
+
+def _serialize_edits(edits, content):
+    return list(edit_rows_data(annotate_rows(edits, content))) # reads the texts stored as blobs
+
+
+def _ndjson_lines(edits, content):
+    edits = list(annotate_rows(edits, content))
+    lines = b''.join(dumps(edit) + b'\n' for edit in edit_rows_data(edits))
+    return lines, edits[-1]['edited_content'] if edits else content
+
+
+async def _stream_edits(edits, content, chunk_size):
+    chunk = []
+    async for edit in edits.aiterator(chunk_size=chunk_size):
+        chunk.append(edit)
+        if len(chunk) == chunk_size:
+            lines, content = await sync_to_async(_ndjson_lines)(chunk, content)
+            yield lines
+            chunk = []
+    if chunk:
+        lines, content = await sync_to_async(_ndjson_lines)(chunk, content)
+        yield lines
+
+
+async def note_version_history_response(request, id):
+    """
+    Async version of notes.views.note_version_history_response.
+    """
+    note_versions = NoteEdit.objects.filter(note_id=id).order_by('edit_timestamp', 'id').values(*EDIT_VALUES)
+    cursor = request.query_params.get('cursor')
+    stream = request.query_params.get('stream')
+    content = ''
+    if cursor is not None: # continue after the last edit of the previous page
+        try:
+            edit_timestamp, edit_id = decode_timestamp_cursor(cursor)
+        except InvalidCursor:
+            return render({'message': 'Invalid cursor.'}, status.HTTP_400_BAD_REQUEST)
+        note_versions = edits_after(note_versions, edit_timestamp, edit_id)
+        content = await sync_to_async(content_at)(id, edit_timestamp, edit_id)
+
+    if stream is not None:
+        if stream != 'ndjson':
+            return render({'message': 'Only ndjson streaming is supported.'}, status.HTTP_400_BAD_REQUEST)
+        chunk_size = getattr(settings, 'NOTES_HISTORY_STREAM_CHUNK_SIZE', 500)
+        return StreamingHttpResponse(_stream_edits(note_versions, content, chunk_size), content_type='application/x-ndjson')
+
+    if cursor is None and 'page_size' not in request.query_params:
+        edits = [edit async for edit in note_versions]
+        return render(await sync_to_async(_serialize_edits)(edits, content), status.HTTP_200_OK)
+
+    try:
+        page_size = get_page_size(request, getattr(settings, 'NOTES_HISTORY_PAGE_SIZE', 100), getattr(settings, 'NOTES_HISTORY_MAX_PAGE_SIZE', 1000))
+    except ValueError:
+        return render({'message': 'page_size must be a positive integer.'}, status.HTTP_400_BAD_REQUEST)
+    edits = [edit async for edit in note_versions[:page_size + 1]] # fetch one extra edit to know if there is a next page
+    next_cursor = None
+    if len(edits) > page_size:
+        edits = edits[:page_size]
+        next_cursor = encode_cursor(edits[-1]['edit_timestamp'], edits[-1]['id'])
+    return render({'results': await sync_to_async(_serialize_edits)(edits, content), 'next_cursor': next_cursor}, status.HTTP_200_OK)
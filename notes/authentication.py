@@ -0,0 +1,125 @@
+"""
+Authentication classes for the notes API.
+"""
+
+import copy
+import threading
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from notes.cache import LRUCache
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+_shared_hits = 0
+
+
+def _token_cache_settings():
+    """
+    Returns the NOTES_TOKEN_CACHE settings merged with the defaults.
+    """
+    options = {'MAX_SIZE': 10000, 'TTL': 300, 'LOCAL_TTL': 5, 'CACHE_ALIAS': None}
+    options.update(getattr(settings, 'NOTES_TOKEN_CACHE', {}))
+    return options
+
+
+def get_token_cache():
+    """
+    Returns the in-process token -> ((user, token), version) cache, creating it on first use.
+
+    Without a shared cache, the invalidations of the other processes are not seen, so the entries
+    only live LOCAL_TTL seconds.
+    """
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                options = _token_cache_settings()
+                ttl = options['TTL'] if options['CACHE_ALIAS'] else min(options['TTL'], options['LOCAL_TTL'])
+                _token_cache = LRUCache(max_size=options['MAX_SIZE'], ttl=ttl)
+    return _token_cache
+
+
+def _shared_cache():
+    """
+    Returns the Django cache backing the in-process cache, or None if it is not configured.
+    """
+    alias = _token_cache_settings()['CACHE_ALIAS']
+    return caches[alias] if alias else None
+
+
+def _shared_cache_key(key):
+    return 'notes:token:' + key
+
+
+def _version_key(key):
+    return 'notes:token-version:' + key
+
+
+def invalidate_token(key):
+    """
+    Removes a token from the in-process and shared caches.
+
+    With a shared cache, the version of the token is also changed, so that the other processes
+    drop their copies of it on their next hit.
+    """
+    get_token_cache().delete(key)
+    shared_cache = _shared_cache()
+    if shared_cache is not None:
+        shared_cache.delete(_shared_cache_key(key))
+        # the cached copies older than the new version expire within TTL, so does the version
+        shared_cache.set(_version_key(key), uuid4().hex, _token_cache_settings()['TTL'])
+
+
+def token_cache_stats():
+    """
+    Returns the hit and miss counters of the token cache.
+
+    hits counts in-process hits, shared_hits the lookups served by the Django cache and
+    misses the lookups that went to the database.
+    """
+    stats = get_token_cache().stats()
+    stats['shared_hits'] = _shared_hits
+    stats['misses'] -= _shared_hits
+    return stats
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication serving token -> user lookups from a cache.
+
+    Lookups are served from an in-process LRU cache with a TTL (NOTES_TOKEN_CACHE['MAX_SIZE'],
+    NOTES_TOKEN_CACHE['TTL']), optionally backed by the Django cache NOTES_TOKEN_CACHE['CACHE_ALIAS'].
+    Entries are invalidated when the token is deleted or its user is saved (see notes.signals),
+    updates bypassing model signals (QuerySet.update) are only picked up after the TTL.
+
+    The entries are stored with the version of their token, read from the shared cache, and are
+    checked against it on every lookup (one cache read), so an invalidation in any process is
+    seen by all of them. Without a shared cache, the entries expire after
+    NOTES_TOKEN_CACHE['LOCAL_TTL'] seconds instead.
+    """
+
+    def authenticate_credentials(self, key):
+        global _shared_hits
+        token_cache = get_token_cache()
+        shared_cache = _shared_cache()
+        entry = token_cache.get(key)
+        version = shared_cache.get(_version_key(key)) if shared_cache is not None else None
+        if entry is not None and entry[1] != version: # invalidated by another process
+            entry = None
+        if entry is None:
+            if shared_cache is not None:
+                entry = shared_cache.get(_shared_cache_key(key))
+                if entry is not None and entry[1] != version:
+                    entry = None
+                if entry is not None:
+                    with _token_cache_lock:
+                        _shared_hits += 1
+            if entry is None: # the version was read before the user, a concurrent invalidation changes it
+                entry = (super().authenticate_credentials(key), version) # raises AuthenticationFailed for invalid tokens and inactive users
+                if shared_cache is not None:
+                    shared_cache.set(_shared_cache_key(key), entry, _token_cache_settings()['TTL'])
+            token_cache.set(key, entry)
+        user, token = entry[0]
+        return (copy.copy(user), token) # requests must not share (and mutate) the same user object
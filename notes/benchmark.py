@@ -0,0 +1,103 @@
+"""
+HTTP load generation for the benchmark commands: concurrent clients sending requests to a
+running server (or to local_server()) and recording the latency of every response.
+"""
+
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    """
+    Request handler not logging every request.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(values, fraction):
+    """
+    Returns the value below which fraction (0 to 1) of the sorted values are.
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_load(urls, headers=None, concurrency=16, requests=1000, timeout=30):
+    """
+    Send requests GET requests to the urls (in turn) from concurrency clients at once. urls may
+    also hold urllib.request.Request objects, sent as they are (e.g. POST requests with their
+    own headers), and responses with a status code of 400 or more are counted as errors.
+
+    Returns:
+        - dict with the number of requests and errors, the throughput (requests per second) and
+          the mean, p50 and p99 latencies in milliseconds.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def client():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            request = urls[index % len(urls)]
+            if not isinstance(request, urllib.request.Request):
+                request = urllib.request.Request(request, headers=headers or {})
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+            except (urllib.error.URLError, OSError) as error: # HTTPError for 4xx and 5xx responses
+                with lock:
+                    errors.append(error)
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for number in range(concurrency):
+            executor.submit(client)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': len(errors),
+        'throughput': len(latencies) / elapsed,
+        'mean_ms': statistics.fmean(latencies) if latencies else None,
+        'p50_ms': percentile(latencies, 0.5),
+        'p99_ms': percentile(latencies, 0.99),
+    }
+
+
+@contextmanager
+def local_server():
+    """
+    Serve the WSGI application of the project (with its middleware) from a thread per request of
+    this process, on a free port of 127.0.0.1, like runserver does.
+
+    Yields:
+        - the base url of the server, e.g. http://127.0.0.1:50123
+    """
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietWSGIRequestHandler)
+    server.set_app(get_internal_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
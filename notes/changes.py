@@ -0,0 +1,128 @@
+"""
+Change feed of the notes accessible by a user.
+
+The feed merges three append-only sources, each read with one indexed query past its own
+position in the cursor:
+    - NoteEdit rows: 'created' (first version) and 'appended' events with the appended text only,
+    - NoteShare rows: 'shared' events with the full note, for notes shared by other users,
+    - NoteTombstone rows: 'deleted' events.
+
+Clients apply created/appended events as content = content[:offset] + content of the event,
+which makes replaying an event that is already reflected in a 'shared' note harmless.
+
+Ids are allocated when rows are inserted, not when they are committed, so on databases with
+concurrent writers (e.g. PostgreSQL) a row can become visible after a row with a higher id was
+read past. Every read therefore also returns again the rows of the last
+NOTES_CHANGES_RESCAN_SECONDS below the cursor (by default 5 seconds, none on SQLite where the
+writes are serialized). Clients must skip the events they already applied: created/appended
+events whose version is not newer than the version of their copy of the note, and 'shared' and
+'deleted' events of notes they already have or have already removed.
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from notes.models import NoteEdit, NoteShare, NoteTombstone
+from notes.storage import resolve_rows
+from notes.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+def decode_changes_cursor(cursor):
+    """
+    Decode a change feed cursor into its (edit id, share id, tombstone id) positions.
+
+    Raises:
+        - InvalidCursor if the cursor is malformed.
+    """
+    positions = decode_cursor(cursor, 3)
+    if not all(isinstance(position, int) and position >= 0 for position in positions):
+        raise InvalidCursor('Invalid cursor.')
+    return positions
+
+
+def rescan_seconds():
+    """
+    Returns the number of seconds of changes below the cursor read again (NOTES_CHANGES_RESCAN_SECONDS).
+    """
+    seconds = getattr(settings, 'NOTES_CHANGES_RESCAN_SECONDS', None)
+    if seconds is None:
+        return 0 if connection.vendor == 'sqlite' else 5
+    return seconds
+
+
+def _read(rows, position, timestamp_field, since, limit):
+    """
+    Returns the rows past position, and the rows at or below it with a timestamp from since if
+    since is not None (they don't move the cursor).
+    """
+    rows = rows.order_by('id')
+    new = list(rows.filter(id__gt=position)[:limit])
+    if since is None or not position:
+        return new, []
+    return new, list(rows.filter(id__lte=position, **{timestamp_field + '__gte': since})[:limit])
+
+
+def changes_since(user, positions=(0, 0, 0), limit=500):
+    """
+    Returns the changes of the notes accessible by the user since the given positions, and the
+    changes of the last rescan_seconds() below them again.
+
+    Returns:
+        - (changes, cursor, has_more) tuple, changes ordered by timestamp. has_more is True if
+          any of the sources had more than limit changes, fetch again from cursor to get them.
+    """
+    edit_id, share_id, tombstone_id = positions
+    seconds = rescan_seconds()
+    since = timezone.now() - timedelta(seconds=seconds) if seconds else None
+    edits, rescanned_edits = _read(
+        NoteEdit.objects.filter(note__noteshare__user=user)
+        .values('id', 'note_id', 'version', 'offset', 'appended_content', 'appended_blob_id', 'edited_by_id', 'edit_timestamp'),
+        edit_id, 'edit_timestamp', since, limit,
+    )
+    shares, rescanned_shares = _read(
+        NoteShare.objects.filter(user=user)
+        .exclude(note__owner=user) # own notes are reported by their 'created' event
+        .values('id', 'note_id', 'note__content', 'note__created_at', 'note__updated_at', 'shared_at'),
+        share_id, 'shared_at', since, limit,
+    )
+    tombstones, rescanned_tombstones = _read(
+        NoteTombstone.objects.filter(user=user).values('id', 'note_id', 'deleted_at'),
+        tombstone_id, 'deleted_at', since, limit,
+    )
+
+    changes = []
+    for edit in resolve_rows(rescanned_edits + edits):
+        changes.append({
+            'type': 'created' if edit['version'] == 1 else 'appended',
+            'note': edit['note_id'],
+            'version': edit['version'],
+            'offset': edit['offset'],
+            'content': edit['appended_content'],
+            'edited_by': edit['edited_by_id'],
+            'timestamp': edit['edit_timestamp'],
+        })
+    for share in rescanned_shares + shares:
+        changes.append({
+            'type': 'shared',
+            'note': share['note_id'],
+            'content': share['note__content'],
+            'created_at': share['note__created_at'],
+            'updated_at': share['note__updated_at'],
+            'timestamp': share['shared_at'],
+        })
+    for tombstone in rescanned_tombstones + tombstones:
+        changes.append({
+            'type': 'deleted',
+            'note': tombstone['note_id'],
+            'timestamp': tombstone['deleted_at'],
+        })
+    changes.sort(key=lambda change: change['timestamp'])
+
+    cursor = encode_cursor(
+        edits[-1]['id'] if edits else edit_id,
+        shares[-1]['id'] if shares else share_id,
+        tombstones[-1]['id'] if tombstones else tombstone_id,
+    )
+    has_more = limit in (len(edits), len(shares), len(tombstones))
+    return changes, cursor, has_more
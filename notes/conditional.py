@@ -0,0 +1,51 @@
+"""
+HTTP validators (ETag and Last-Modified) of notes and their version history, for conditional requests.
+
+A note only changes together with its updated_at, and its history only grows, so:
+    - the ETag of a note is built from its id and updated_at,
+    - the ETag of the history of a note is built from its id and the id of its last edit.
+Both can be computed without loading the content of the note.
+"""
+
+from datetime import datetime, timedelta, timezone
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def note_etag(note_id, updated_at):
+    """
+    Returns the (strong) ETag of a note.
+    """
+    return f'"note-{note_id}-{(updated_at - EPOCH) // timedelta(microseconds=1)}"'
+
+
+def history_etag(note_id, last_edit_id):
+    """
+    Returns the (strong) ETag of the version history of a note.
+    """
+    return f'"history-{note_id}-{last_edit_id}"'
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Set the ETag and Last-Modified headers of a response and return it.
+    """
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def conditional_response(request, etag, last_modified):
+    """
+    Evaluate the conditional headers of a request (If-Match, If-None-Match, If-Modified-Since,
+    If-Unmodified-Since) against the validators of the resource.
+
+    Returns:
+        - a 304 NOT MODIFIED or 412 PRECONDITION FAILED response, or None if the request should proceed.
+    """
+    response = set_validators(HttpResponse(), etag, last_modified) # headers copied to a 304 response
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()), response=response)
+    return None if conditional is response else conditional
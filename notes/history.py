@@ -0,0 +1,119 @@
+"""
+Helpers for rebuilding note version history from delta encoded NoteEdit rows.
+"""
+
+from django.db.models import Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from notes.models import NoteEdit
+from notes.storage import resolve_edits, resolve_rows
+
+
+def replay_edits(edits, content=''):
+    """
+    Rebuild the previous and edited content for a sequence of edits.
+
+    Parameters:
+        - edits: iterable of NoteEdit objects of a single note in edit order.
+        - content: content of the note before the first edit in edits ('' when replaying from the start).
+
+    Yields:
+        - (edit, previous_content, edited_content) for every edit.
+    """
+    for edit in resolve_edits(edits): # read back the texts stored as blobs
+        previous_content = content[:edit.offset]
+        if edit.snapshot_content is not None: # snapshots are authoritative for the edited content
+            content = edit.snapshot_content
+        else:
+            content = previous_content + edit.appended_content
+        yield edit, previous_content, content
+
+
+def annotate_edits(edits, content=''):
+    """
+    Set previous_content and edited_content on every edit so that it can be serialized
+    with NoteEditSerializer.
+
+    Yields the annotated NoteEdit objects.
+    """
+    for edit, previous_content, edited_content in replay_edits(edits, content):
+        edit.previous_content = previous_content
+        edit.edited_content = edited_content
+        yield edit
+
+
+# values() of the NoteEdit rows replayed by annotate_rows
+EDIT_VALUES = ('id', 'note_id', 'edited_by_id', 'edit_timestamp', 'offset', 'appended_content', 'snapshot_content', 'appended_blob_id', 'snapshot_blob_id')
+
+
+def annotate_rows(rows, content=''):
+    """
+    Version of annotate_edits for NoteEdit values(*EDIT_VALUES) rows, which skips building model
+    instances: sets previous_content and edited_content on every row.
+
+    Yields the annotated rows.
+    """
+    for row in resolve_rows(rows): # read back the texts stored as blobs
+        row['previous_content'] = content[:row['offset']]
+        if row['snapshot_content'] is not None: # snapshots are authoritative for the edited content
+            content = row['snapshot_content']
+        else:
+            content = row['previous_content'] + row['appended_content']
+        row['edited_content'] = content
+        yield row
+
+
+def edits_after(edits, edit_timestamp, edit_id):
+    """
+    Filter a NoteEdit queryset down to the edits after the (edit_timestamp, id) position.
+    """
+    return edits.filter(Q(edit_timestamp__gt=edit_timestamp) | Q(edit_timestamp=edit_timestamp, id__gt=edit_id))
+
+
+def edits_until(edits, edit_timestamp, edit_id):
+    """
+    Filter a NoteEdit queryset down to the edits up to and including the (edit_timestamp, id) position.
+    """
+    return edits.filter(Q(edit_timestamp__lt=edit_timestamp) | Q(edit_timestamp=edit_timestamp, id__lte=edit_id))
+
+
+def content_at(note_id, edit_timestamp, edit_id):
+    """
+    Rebuild the content of a note right after the edit at the (edit_timestamp, id) position.
+
+    Replays the edits from the closest snapshot at or before that position, so at most
+    NOTES_HISTORY_SNAPSHOT_INTERVAL edits are read.
+    """
+    edits = edits_until(NoteEdit.objects.filter(note_id=note_id), edit_timestamp, edit_id)
+    snapshot = edits.filter(snapshot_content__isnull=False).order_by('-edit_timestamp', '-id').values('edit_timestamp', 'id', 'snapshot_content', 'snapshot_blob_id').first()
+    content = ''
+    if snapshot is not None:
+        content = next(resolve_rows([snapshot]))['snapshot_content']
+        edits = edits_after(edits, snapshot['edit_timestamp'], snapshot['id'])
+    edits = edits.order_by('edit_timestamp', 'id').only('offset', 'appended_content', 'snapshot_content', 'appended_blob', 'snapshot_blob')
+    for edit, previous_content, edited_content in replay_edits(edits, content):
+        content = edited_content
+    return content
+
+
+def content_as_of(note_id, version=None, at=None):
+    """
+    Rebuild the content of a note as of a version, or as of a timestamp (the last version edited at or before it).
+
+    The edits from the closest snapshot up to that version are read with a single query on the
+    (note, version) index, so at most NOTES_HISTORY_SNAPSHOT_INTERVAL edits are read.
+
+    Returns:
+        - (content, edit) tuple, edit being the NoteEdit of that version, or None if the note
+          had no such version (or did not exist yet at that time).
+    """
+    edits = NoteEdit.objects.filter(note_id=note_id)
+    if at is not None:
+        version = Subquery(edits.filter(edit_timestamp__lte=at).order_by('-edit_timestamp', '-id').values('version')[:1])
+    snapshot = edits.filter(version__lte=version, snapshot_content__isnull=False).order_by('-version').values('version')[:1]
+    edits = edits.filter(version__lte=version, version__gte=Coalesce(Subquery(snapshot), Value(0))).order_by('version')
+    content, edit = '', None
+    for edit, previous_content, content in replay_edits(edits, content):
+        pass
+    if at is None and edit is not None and edit.version != version: # past the last version
+        edit = None
+    return content, edit
@@ -0,0 +1,199 @@
+"""
+Durable queue of the work following a write which doesn't have to be done by the request (e.g.
+indexing the text appended to a note), stored in the NoteJob table.
+
+A job has a kind, naming its handler, and a JSON payload. Handlers are registered with the
+job_handler decorator in the modules of NOTES_JOBS['HANDLER_MODULES'] and take a list of payloads.
+A payload with a note_id is run after the jobs enqueued before it for the same note.
+
+With NOTES_JOBS['INLINE'] (the default), enqueue runs the handler right away, in the transaction
+of the write. Otherwise the jobs are inserted in that transaction and run by
+`manage.py run_notes_worker`, which claims batches of jobs and runs them on a thread pool, one
+thread per note so that the jobs of a note keep their order. A failing job is retried
+MAX_ATTEMPTS times, RETRY_DELAY seconds later then twice as late every time, the later jobs of its
+note waiting for it. A job claimed by a worker which died is claimed again after LEASE seconds.
+Run a single worker process on SQLite, several on databases with row locks (SELECT ... FOR UPDATE).
+"""
+
+import logging
+import threading
+from contextlib import nullcontext
+from datetime import timedelta
+from importlib import import_module
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from notes.models import NoteJob
+
+logger = logging.getLogger('notes.jobs')
+
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def get_options():
+    """
+    Returns the NOTES_JOBS options, with their defaults.
+    """
+    options = {
+        'INLINE': True,
+        'HANDLER_MODULES': ['notes.services'],
+        'THREADS': 4,
+        'BATCH_SIZE': 100,
+        'MAX_ATTEMPTS': 5,
+        'RETRY_DELAY': 10,
+        'LEASE': 300,
+        'KEEP_DONE': 86400,
+        'POLL_INTERVAL': 1,
+        'WARM_NOTE_CACHE': False,
+    }
+    options.update(getattr(settings, 'NOTES_JOBS', {}))
+    return options
+
+
+def job_handler(kind, atomic=True):
+    """
+    Register the decorated function as the handler of the jobs of a kind. The handler of an
+    atomic kind runs in the transaction marking its job done, the others (e.g. running their own
+    short transactions) must be idempotent as they may be run again after a crash.
+    """
+    def register(function):
+        _handlers[kind] = (function, atomic)
+        return function
+    return register
+
+
+def get_handler(kind):
+    """
+    Returns the (handler, atomic) of a kind of job.
+
+    Raises:
+        - KeyError if no handler is registered for the kind.
+    """
+    if kind not in _handlers:
+        with _handlers_lock:
+            for module in get_options()['HANDLER_MODULES']:
+                import_module(module)
+    return _handlers[kind]
+
+
+def enqueue(kind, payload, idempotency_key=None, background_only=False):
+    """
+    Enqueue a job, see enqueue_many.
+    """
+    enqueue_many(kind, [payload], [idempotency_key], background_only)
+
+
+def enqueue_many(kind, payloads, idempotency_keys=None, background_only=False):
+    """
+    Enqueue a job for every payload, in order, with one insert. The jobs whose idempotency key is
+    already used are not enqueued.
+
+    In inline mode, the handler is run right away instead, or not at all for background_only jobs
+    (work done some other way when there is no worker, e.g. by a management command).
+    """
+    if not payloads:
+        return
+    options = get_options()
+    if options['INLINE']:
+        if not background_only:
+            get_handler(kind)[0](payloads)
+        return
+    idempotency_keys = idempotency_keys or [None] * len(payloads)
+    NoteJob.objects.bulk_create(
+        [NoteJob(kind=kind, note_id=payload.get('note_id'), payload=payload, idempotency_key=key) for payload, key in zip(payloads, idempotency_keys)],
+        batch_size=getattr(settings, 'NOTES_BULK_BATCH_SIZE', 1000),
+        ignore_conflicts=True, # idempotency keys already used
+    )
+
+
+def claim_jobs(batch_size):
+    """
+    Mark up to batch_size jobs due to run as running (for LEASE seconds) and returns them, in
+    order, leaving out the jobs of the notes with an earlier job running or waiting for a retry.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # release the jobs of dead workers, starts with the write so the transaction never waits to upgrade a read lock
+        NoteJob.objects.filter(status=NoteJob.RUNNING, locked_until__lt=now).update(status=NoteJob.PENDING, locked_until=None)
+        # an earlier job of the same note running or waiting for a retry, selected in SQL so any number of them is skipped
+        blocking = NoteJob.objects.filter(
+            Q(status=NoteJob.RUNNING) | Q(status=NoteJob.PENDING, run_after__gt=now), note_id=OuterRef('note_id'), id__lt=OuterRef('id'),
+        )
+        due = NoteJob.objects.select_for_update().filter(status=NoteJob.PENDING, run_after__lte=now).exclude(Exists(blocking))
+        jobs = list(due.order_by('id')[:batch_size])
+        NoteJob.objects.filter(id__in=[job.id for job in jobs]).update(status=NoteJob.RUNNING, locked_until=now + timedelta(seconds=get_options()['LEASE']))
+    return jobs
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its outcome.
+
+    Returns:
+        - False if the job failed and will be retried, True otherwise.
+    """
+    options = get_options()
+    try:
+        handler, atomic = get_handler(job.kind)
+        with transaction.atomic() if atomic else nullcontext():
+            handler([job.payload])
+            NoteJob.objects.filter(id=job.id).update(status=NoteJob.DONE, attempts=job.attempts + 1, locked_until=None, finished_at=timezone.now())
+        return True
+    except Exception as error:
+        logger.exception('Job %s failed.', job)
+        attempts = job.attempts + 1
+        retry = attempts < options['MAX_ATTEMPTS']
+        now = timezone.now()
+        NoteJob.objects.filter(id=job.id).update(
+            status=NoteJob.PENDING if retry else NoteJob.FAILED,
+            attempts=attempts,
+            last_error=repr(error),
+            run_after=now + timedelta(seconds=options['RETRY_DELAY'] * 2 ** (attempts - 1)),
+            locked_until=None,
+            finished_at=None if retry else now,
+        )
+        return not retry
+
+
+def run_jobs(jobs):
+    """
+    Run claimed jobs one after the other, in a worker thread. The jobs after a job to be retried
+    are given back to the queue, to run after it.
+
+    Returns:
+        - number of jobs run.
+    """
+    try:
+        for index, job in enumerate(jobs):
+            if not run_job(job):
+                NoteJob.objects.filter(id__in=[later.id for later in jobs[index + 1:]]).update(status=NoteJob.PENDING, locked_until=None)
+                return index + 1
+        return len(jobs)
+    finally:
+        connection.close() # connections are per thread
+
+
+def run_batch(executor, batch_size):
+    """
+    Claim a batch of jobs and run them on the executor (a thread pool), the jobs of a note
+    sequentially in one thread.
+
+    Returns:
+        - number of jobs run (0 if none was due).
+    """
+    groups = {}
+    for job in claim_jobs(batch_size):
+        groups.setdefault(job.note_id if job.note_id is not None else ('job', job.id), []).append(job)
+    return sum(future.result() for future in [executor.submit(run_jobs, group) for group in groups.values()])
+
+
+def delete_finished_jobs():
+    """
+    Delete the jobs done more than KEEP_DONE seconds ago (the failed ones are kept).
+
+    Returns:
+        - number of jobs deleted.
+    """
+    return NoteJob.objects.filter(status=NoteJob.DONE, finished_at__lt=timezone.now() - timedelta(seconds=get_options()['KEEP_DONE'])).delete()[0]
@@ -0,0 +1,201 @@
+import json
+import urllib.parse
+import urllib.request
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.urls import resolve
+from rest_framework.authtoken.models import Token
+from notes import urls as notes_urls
+from notes.benchmark import local_server, run_load
+from notes.metrics import get_options as get_metrics_options, get_registry
+from notes.models import NeofiUser, Note
+from notes.search import get_search_engine
+from notes.services import append_to_note, create_notes_in_bulk, share_notes
+from notes.transfer import export_ndjson
+
+PASSWORD = 'benchmark-password'
+
+# Maximum database queries per request of every scenario, with room for the reloads of the access
+# cache and the retries of concurrent updates. They don't depend on the size of the dataset, so a
+# scenario going over its budget makes a query per note, share or edit (N+1).
+QUERY_BUDGETS = {
+    'signup': 3,
+    'login': 3,
+    'list_notes': 2,
+    'create_notes': 6,
+    'create_notes_bulk': 6,
+    'export_notes': 4, # one chunk of NOTES_BULK_BATCH_SIZE notes
+    'import_notes': 10,
+    'note_changes': 4,
+    'search_notes': 2,
+    'share_note': 5,
+    'note_version_history': 4,
+    'note_version_history_stream': 4,
+    'append_note': 8,
+    'retrieve_note': 2, # the version of the cached note, and the note on a miss
+    'update_note': 12,
+    'delete_note': 8,
+    'metrics': 0,
+}
+
+# Endpoints of notes/urls.py which can't be benchmarked by requests with a response time
+SKIPPED = {
+    'note_events': 'Server-Sent Events stream, only served through ASGI and never completed by the server.',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a dataset (users, notes shared between them, a note with a long history), serve the project '
+        'from a local threaded server and load every endpoint of notes/urls.py with concurrent clients. '
+        'Writes a JSON report with the throughput, p50/p99 latencies and queries per request of every '
+        'endpoint, and fails if an endpoint makes more queries per request than its budget.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='number of users the notes are shared with')
+        parser.add_argument('--notes', type=int, default=20, help='notes per user')
+        parser.add_argument('--history', type=int, default=500, help='number of edits of the note whose version history is downloaded')
+        parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent clients')
+        parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+        parser.add_argument('--budget', action='append', default=[], metavar='ENDPOINT=QUERIES', help='override the query budget of an endpoint')
+        parser.add_argument('--output', default='-', help='file the JSON report is written to (stdout by default)')
+        parser.add_argument('--keep', action='store_true', help='keep the users and notes created for the run')
+
+    def handle(self, *args, **options):
+        budgets = dict(QUERY_BUDGETS)
+        for budget in options['budget']:
+            endpoint, _, queries = budget.partition('=')
+            if endpoint not in budgets or not queries.isdigit():
+                raise CommandError(f'Invalid budget {budget!r}, expected ENDPOINT=QUERIES with ENDPOINT one of {", ".join(budgets)}.')
+            budgets[endpoint] = int(queries)
+
+        run = uuid.uuid4().hex[:12]
+        data = self.seed(run, options)
+        try:
+            # the queries are counted by notes.middleware.MetricsMiddleware, without logging the slow requests,
+            # and /metrics/ is enabled with a token for the run if none is set
+            metrics_options = {**getattr(settings, 'NOTES_METRICS', {}), 'ENABLED': True, 'SLOW_REQUEST_MS': None, 'TOKEN': get_metrics_options()['TOKEN'] or uuid.uuid4().hex}
+            with override_settings(NOTES_METRICS=metrics_options), local_server() as base_url:
+                endpoints = {}
+                for name, requests in self.scenarios(base_url, run, data, options['requests']):
+                    endpoints[name] = self.measure(requests, options)
+                    endpoints[name]['query_budget'] = budgets.get(name)
+        finally:
+            if not options['keep']:
+                self.clean(run)
+
+        covered = {endpoint['route'] for endpoint in endpoints.values()}
+        report = {
+            'dataset': {option: options[option] for option in ('users', 'notes', 'history')},
+            'concurrency': options['concurrency'],
+            'endpoints': endpoints,
+            'skipped': {name: reason for name, reason in SKIPPED.items()},
+            'not_covered': sorted(pattern.name for pattern in notes_urls.urlpatterns if pattern.name not in covered and pattern.name not in SKIPPED),
+            'over_budget': sorted(
+                name for name, endpoint in endpoints.items()
+                if None not in (endpoint['query_budget'], endpoint['queries_per_request']) and endpoint['queries_per_request'] > endpoint['query_budget']
+            ),
+        }
+        output = json.dumps(report, indent=2) + '\n'
+        if options['output'] == '-':
+            self.stdout.write(output, ending='')
+        else:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        if report['over_budget']:
+            raise CommandError('Query budget exceeded by: ' + ', '.join(
+                f'{name} ({endpoints[name]["queries_per_request"]} > {endpoints[name]["query_budget"]})' for name in report['over_budget']
+            ))
+
+    def seed(self, run, options):
+        """
+        Create the users of the run, their notes shared with each other, the note with a long
+        history and the export imported by the import scenario.
+        """
+        user = NeofiUser.objects.create_user(f'benchmark-{run}@example.com', f'benchmark-{run}', PASSWORD)
+        others = [NeofiUser.objects.create_user(f'benchmark-{run}-{index}@example.com', f'benchmark-{run}-{index}') for index in range(options['users'])]
+        note_ids = create_notes_in_bulk(user, [f'Benchmark note {index} of {user.username}.' for index in range(options['notes'])])
+        share_notes(user, note_ids, [other.id for other in others])
+        for other in others:
+            other_note_ids = create_notes_in_bulk(other, [f'Benchmark note {index} of {other.username}.' for index in range(options['notes'])])
+            share_notes(other, other_note_ids, [user.id])
+        history_note_id, append_note_id, update_note_id = create_notes_in_bulk(user, ['', 'Appended benchmark note.', 'Updated benchmark note.'])
+        for index in range(options['history']):
+            append_to_note(history_note_id, user, f'Line {index} of the benchmark note.\n')
+        return {
+            'token': Token.objects.create(user=user).key,
+            'user': user,
+            'note_ids': note_ids,
+            'user_ids': [other.id for other in others],
+            'history_note_id': history_note_id,
+            'append_note_id': append_note_id,
+            'update_note_id': update_note_id,
+            'export': b''.join(export_ndjson(others[0])) if others else b'',
+        }
+
+    def scenarios(self, base_url, run, data, requests):
+        """
+        Yields the name and requests (urllib.request.Request objects) of every scenario.
+        """
+        headers = {'Authorization': f'Token {data["token"]}', 'Content-Type': 'application/json'}
+
+        def request(path, body=None, method='GET', headers=headers):
+            if body is not None and not isinstance(body, bytes):
+                body = json.dumps(body).encode()
+            return urllib.request.Request(f'{base_url}/{path}', data=body, headers=headers, method=method)
+
+        history = data['history_note_id']
+        yield 'signup', [
+            request('signup/', {'email': f'benchmark-{run}-signup-{index}@example.com', 'username': f'benchmark-{run}-signup-{index}', 'password': PASSWORD, 'confirm_password': PASSWORD}, 'POST', {'Content-Type': 'application/json'})
+            for index in range(requests)
+        ]
+        yield 'login', [request('login/', {'email': data['user'].email, 'password': PASSWORD}, 'POST', {'Content-Type': 'application/json'})]
+        # the reads run on the seeded notes only, before the writes add notes
+        yield 'list_notes', [request('notes/')]
+        yield 'retrieve_note', [request(f'notes/{history}/')]
+        yield 'export_notes', [request('notes/export/')]
+        yield 'note_changes', [request('notes/changes/')]
+        yield 'search_notes', [request('notes/search/?q=benchmark+note')]
+        yield 'note_version_history', [request(f'notes/version-history/{history}/')]
+        yield 'note_version_history_stream', [request(f'notes/version-history/{history}/?stream=ndjson')]
+        token = get_metrics_options()['TOKEN']
+        yield 'metrics', [request('metrics/', headers={'Authorization': f'Bearer {token}'} if token else {})]
+        yield 'create_notes', [request('notes/create/', {'content': 'Created benchmark note.'}, 'POST')]
+        yield 'create_notes_bulk', [request('notes/bulk/', {'contents': [f'Bulk benchmark note {index}.' for index in range(5)]}, 'POST')]
+        yield 'import_notes', [request('notes/import/', data['export'], 'POST', {**headers, 'Content-Type': 'application/x-ndjson'})]
+        yield 'share_note', [request('notes/share/', {'note_ids': data['note_ids'], 'user_ids': data['user_ids']}, 'POST')]
+        yield 'append_note', [request(f'notes/{data["append_note_id"]}/append/', {'content': ' More.'}, 'PATCH')]
+        yield 'update_note', [request(f'notes/{data["update_note_id"]}/', {'content': 'Updated benchmark note.'}, 'PUT')]
+        deleted_note_ids = create_notes_in_bulk(data['user'], [f'Deleted benchmark note {index}.' for index in range(requests)])
+        yield 'delete_note', [request(f'notes/{note_id}/', method='DELETE') for note_id in deleted_note_ids]
+
+    def measure(self, requests, options):
+        """
+        Send the requests of a scenario and returns its stats, with the queries per request
+        recorded by the metrics of its route.
+        """
+        route = resolve(urllib.parse.urlsplit(requests[0].full_url).path).url_name
+        before = get_registry().snapshot()[1].get(route, {'count': 0, 'queries': 0})
+        stats = run_load(requests, concurrency=options['concurrency'], requests=options['requests'])
+        after = get_registry().snapshot()[1].get(route, {'count': 0, 'queries': 0})
+        served = after['count'] - before['count']
+        return {
+            'route': route,
+            'method': requests[0].get_method(),
+            **stats,
+            'queries_per_request': round((after['queries'] - before['queries']) / served, 2) if served else None,
+        }
+
+    def clean(self, run):
+        """
+        Delete the users of the run (signed up ones included) with their notes.
+        """
+        users = NeofiUser.objects.filter(email__startswith=f'benchmark-{run}')
+        with transaction.atomic():
+            for note_id in Note.all_objects.filter(owner__in=users).values_list('id', flat=True).iterator(): # deleted notes too, indexed until purged
+                get_search_engine().remove(note_id)
+            users.delete()
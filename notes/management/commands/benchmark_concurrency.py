@@ -0,0 +1,49 @@
+import uuid
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+from notes.benchmark import run_load
+from notes.models import NeofiUser, Note, NoteEdit, NoteShare
+from notes.services import append_to_note, delete_note
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the request concurrency of running deployments (e.g. the sync gunicorn one and the ASGI one '
+        'with NOTES_ASYNC_VIEWS) on the note list, retrieval and version history. The deployments must use '
+        'the database configured here, where the benchmark user and note are created.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='base urls of the deployments, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=32, help='number of concurrent clients')
+        parser.add_argument('--requests', type=int, default=1000, help='requests per deployment')
+        parser.add_argument('--history', type=int, default=200, help='number of edits of the note, the size of the version history downloaded')
+        parser.add_argument('--keep', action='store_true', help='keep the note and user created for the run')
+
+    def handle(self, *args, **options):
+        user = NeofiUser.objects.create_user(f'benchmark-{uuid.uuid4().hex}@example.com', 'benchmark')
+        token = Token.objects.create(user=user)
+        note = Note.objects.create(owner=user, content='')
+        NoteShare.objects.create(note=note, user=user)
+        NoteEdit.objects.record_edit(note_id=note.id, edited_by=user, offset=0, appended_content='')
+        for index in range(options['history']):
+            append_to_note(note.id, user, f'Line {index} of the benchmark note.\n')
+
+        paths = ['notes/', f'notes/{note.id}/', f'notes/version-history/{note.id}/', f'notes/version-history/{note.id}/?stream=ndjson']
+        try:
+            for base_url in options['urls']:
+                stats = run_load(
+                    [base_url.rstrip('/') + '/' + path for path in paths],
+                    headers={'Authorization': f'Token {token.key}'},
+                    concurrency=options['concurrency'],
+                    requests=options['requests'],
+                )
+                self.stdout.write(
+                    f'{base_url}: {stats["throughput"]:.1f} requests/s, p50 {stats["p50_ms"] or 0:.1f} ms, '
+                    f'p99 {stats["p99_ms"] or 0:.1f} ms, {stats["errors"]} errors of {stats["requests"]} requests '
+                    f'by {options["concurrency"]} clients.'
+                )
+        finally:
+            if not options['keep']:
+                delete_note(note.id)
+                user.delete()
@@ -0,0 +1,72 @@
+import json
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from notes.history import EDIT_VALUES, annotate_edits, annotate_rows
+from notes.models import NeofiUser, Note, NoteEdit, NoteShare, snapshot_interval
+from notes.renderers import dumps, orjson
+from notes.serializers import NoteEditSerializer, edit_rows_data
+from notes.services import delete_note
+from notes.storage import save_edits
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the time to serialize the version history of a note with many edits through NoteEditSerializer '
+        'and the DRF JSONRenderer, and through the values() fast path and the orjson renderer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--edits', type=int, default=10000, help='number of edits of the note')
+        parser.add_argument('--append-size', type=int, default=1, help='characters appended by every edit (the history holds the full content of every version)')
+        parser.add_argument('--repeat', type=int, default=3, help='runs of every path, the fastest is reported')
+        parser.add_argument('--keep', action='store_true', help='keep the note and user created for the run')
+
+    def handle(self, *args, **options):
+        user = NeofiUser.objects.create_user(f'benchmark-{uuid.uuid4().hex}@example.com', 'benchmark')
+        note = Note.objects.create(owner=user, content='')
+        NoteShare.objects.create(note=note, user=user)
+        edits = []
+        content = ''
+        for version in range(1, options['edits'] + 1):
+            appended_content = str(version % 10) * options['append_size']
+            edits.append(NoteEdit(
+                note=note,
+                edited_by=user,
+                version=version,
+                offset=len(content),
+                appended_content=appended_content,
+                snapshot_content=content + appended_content if version % snapshot_interval() == 0 else None,
+            ))
+            content += appended_content
+        save_edits(edits)
+        Note.objects.filter(id=note.id).update(content=content)
+
+        history = NoteEdit.objects.filter(note_id=note.id).order_by('edit_timestamp', 'id')
+        paths = {
+            'NoteEditSerializer + JSONRenderer': lambda: JSONRenderer().render(NoteEditSerializer(annotate_edits(history), many=True).data),
+            'values() + fast renderer': lambda: dumps(list(edit_rows_data(annotate_rows(history.values(*EDIT_VALUES))))),
+        }
+        try:
+            outputs = {}
+            timings = {}
+            for name, path in paths.items():
+                for run in range(options['repeat']):
+                    start = time.perf_counter()
+                    outputs[name] = path()
+                    timings[name] = min(timings.get(name, float('inf')), time.perf_counter() - start)
+            if len({json.dumps(json.loads(output)) for output in outputs.values()}) != 1:
+                raise CommandError('The serialization paths returned different histories.')
+        finally:
+            if not options['keep']:
+                delete_note(note.id)
+                user.delete()
+
+        baseline = timings['NoteEditSerializer + JSONRenderer']
+        for name, elapsed in timings.items():
+            self.stdout.write(f'{name}: {elapsed * 1000:.0f} ms ({baseline / elapsed:.1f}x)')
+        self.stdout.write(
+            f'{options["edits"]} edits, {len(outputs[name]) / 1e6:.1f} MB of JSON, '
+            f'fast renderer: {"orjson" if orjson is not None else "json (install orjson)"}.'
+        )
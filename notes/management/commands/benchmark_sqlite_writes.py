@@ -0,0 +1,88 @@
+import threading
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+from notes.models import NeofiUser, Note, NoteEdit, NoteShare
+from notes.search import get_search_engine
+from notes.services import NoteAppendConflict, NoteNotExtended, delete_note, extend_note
+from notes.sqlite import get_options
+
+# The SQLite defaults, the journal mode is set explicitly as WAL persists in the database file
+BASELINE = {'ENABLED': True, 'JOURNAL_MODE': 'DELETE', 'SYNCHRONOUS': None, 'BUSY_TIMEOUT': None, 'MMAP_SIZE': None, 'CACHE_SIZE': None}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the throughput of concurrent note creations and updates on the SQLite database, '
+        'with the SQLite defaults and with the NOTES_SQLITE tuning. Writes to the configured database, '
+        'point DATABASE_URL to a copy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='number of concurrent writers')
+        parser.add_argument('--writes', type=int, default=100, help='writes per writer, alternately a creation and an update')
+        parser.add_argument('--mode', default='both', choices=['both', 'baseline', 'tuned'], help='configuration(s) measured')
+        parser.add_argument('--keep', action='store_true', help='keep the notes and user created for the run')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The default database is not a SQLite database.')
+        tuned = {**get_options(), 'ENABLED': True}
+        modes = [('baseline', BASELINE), ('tuned', tuned)]
+        for name, sqlite_options in modes:
+            if options['mode'] in ('both', name):
+                with override_settings(NOTES_SQLITE=sqlite_options):
+                    self.run(name, options)
+
+    def run(self, name, options):
+        connection.close() # reconnect with the options of the run, which also switches the journal mode
+        user = NeofiUser.objects.create_user(f'benchmark-{uuid.uuid4().hex}@example.com', 'benchmark')
+        note_ids = []
+        errors = []
+        lock = threading.Lock()
+
+        def writer():
+            note = None
+            try:
+                for index in range(options['writes']):
+                    try:
+                        if note is None or index % 2 == 0: # POST /notes/create/
+                            note = Note.objects.create(owner=user, content='benchmark')
+                            NoteShare.objects.create(note=note, user=user)
+                            NoteEdit.objects.record_edit(note_id=note.id, edited_by=user, offset=0, appended_content=note.content, edited_content=note.content)
+                            get_search_engine().index_append(note.id, note.content)
+                            with lock:
+                                note_ids.append(note.id)
+                        else: # PUT /notes/<id>/
+                            extend_note(note.id, user, note.content + f' {index}')
+                            note.content += f' {index}'
+                    except (OperationalError, NoteAppendConflict, NoteNotExtended) as error: # e.g. database is locked
+                        with lock:
+                            errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer) for number in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        if not options['keep']:
+            for note_id in note_ids:
+                delete_note(note_id)
+            user.delete()
+
+        writes = options['threads'] * options['writes']
+        self.stdout.write(
+            f'{name} ({journal_mode} journal): {writes} writes by {options["threads"]} threads in {elapsed:.2f}s, '
+            f'{(writes - len(errors)) / elapsed:.1f} writes/s, {len(errors)} failed'
+            + (f' (e.g. {errors[0]})' if errors else '') + '.'
+        )
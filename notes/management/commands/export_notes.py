@@ -0,0 +1,23 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from notes.models import NeofiUser
+from notes.transfer import export_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Export the notes of a user, with their version history and shares, as NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='email of the owner of the notes')
+        parser.add_argument('--output', '-o', default='-', help='file to write the export to (standard output by default)')
+        parser.add_argument('--gzip', action='store_true', help='gzip the export (default if the output ends with .gz)')
+
+    def handle(self, *args, **options):
+        owner = NeofiUser.objects.filter(email=options['email']).first()
+        if owner is None:
+            raise CommandError(f"No user with email {options['email']}.")
+        output = options['output']
+        compress = options['gzip'] or output.endswith('.gz')
+        with (open(output, 'wb') if output != '-' else open(sys.stdout.fileno(), 'wb', closefd=False)) as file:
+            for data in export_ndjson(owner, compress=compress):
+                file.write(data)
@@ -0,0 +1,29 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from notes.models import NeofiUser
+from notes.transfer import NoteImportError, import_records, read_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Import notes exported with export_notes (or GET /notes/export/) as notes of a user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='email of the user to import the notes for')
+        parser.add_argument('--input', '-i', default='-', help='file to read the export from (standard input by default)')
+        parser.add_argument('--gzip', action='store_true', help='the export is gzipped (default if the input ends with .gz)')
+        parser.add_argument('--batch-size', type=int, default=None, help='rows per insert (NOTES_BULK_BATCH_SIZE by default)')
+
+    def handle(self, *args, **options):
+        owner = NeofiUser.objects.filter(email=options['email']).first()
+        if owner is None:
+            raise CommandError(f"No user with email {options['email']}.")
+        path = options['input']
+        compressed = options['gzip'] or path.endswith('.gz')
+        with (open(path, 'rb') if path != '-' else open(sys.stdin.fileno(), 'rb', closefd=False)) as file:
+            try:
+                counts = import_records(owner, read_ndjson(file, compressed=compressed), batch_size=options['batch_size'])
+            except (NoteImportError, OSError, EOFError) as error:
+                raise CommandError(f'Note import failed. {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['notes']} notes, {counts['edits']} edits and {counts['shares']} shares ({counts['skipped']} records skipped)."
+        ))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Length
+from notes.models import ContentBlob, NoteEdit
+from notes.storage import externalize, get_options
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the large texts of the version history stored inline to compressed, deduplicated blobs '
+        '(see NOTES_CONTENT_STORAGE) and report the space saved.'
+    )
+
+    def add_arguments(self, parser):
+        options = get_options()
+        parser.add_argument('--min-size', type=int, default=options['MIN_SIZE'], help='move the texts of at least this many characters')
+        parser.add_argument('--codec', default=options['CODEC'], choices=['zlib', 'zstd'], help='compression of the new blobs')
+        parser.add_argument('--batch-size', type=int, default=500, help='edits moved per transaction')
+        parser.add_argument('--prune', action='store_true', help='also delete the blobs not used anymore (e.g. of deleted notes); run it while no notes are edited')
+
+    def handle(self, *args, **options):
+        min_size = max(1, options['min_size'])
+        stored_before = ContentBlob.objects.aggregate(size=Sum('stored_size'))['size'] or 0
+        moved_texts = moved_size = 0
+        edits = (
+            NoteEdit.objects.annotate(appended_length=Length('appended_content'), snapshot_length=Length('snapshot_content'))
+            .filter(Q(appended_blob__isnull=True, appended_length__gte=min_size) | Q(snapshot_blob__isnull=True, snapshot_length__gte=min_size))
+            .order_by('id')
+            .only('id', 'appended_content', 'snapshot_content', 'appended_blob', 'snapshot_blob')
+        )
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                batch = list(edits.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                moved = externalize(batch, min_size, options['codec'])
+                NoteEdit.objects.bulk_update([edit for edit, texts in moved], ['appended_content', 'snapshot_content', 'appended_blob', 'snapshot_blob'])
+            last_id = batch[-1].id
+            for edit, texts in moved:
+                moved_texts += len(texts)
+                moved_size += sum(len(text.encode()) for text in texts.values())
+            self.stdout.write(f'Moved {moved_texts} texts so far.')
+
+        pruned = 0
+        if options['prune']:
+            used = Q(id__in=NoteEdit.objects.filter(appended_blob__isnull=False).values('appended_blob')) | Q(id__in=NoteEdit.objects.filter(snapshot_blob__isnull=False).values('snapshot_blob'))
+            pruned = ContentBlob.objects.exclude(used).delete()[0]
+
+        stored_after = ContentBlob.objects.aggregate(size=Sum('stored_size'))['size'] or 0
+        if not get_options()['ENABLED']:
+            self.stdout.write(self.style.WARNING('NOTES_CONTENT_STORAGE is not enabled, new edits are still stored inline.'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved_texts} texts ({moved_size} bytes) to blobs, blobs grew by {stored_after - stored_before} bytes '
+            f'({pruned} unused blobs pruned): {moved_size - (stored_after - stored_before)} bytes saved.'
+        ))
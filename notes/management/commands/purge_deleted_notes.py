@@ -0,0 +1,26 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from notes.services import purge_deleted_notes
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove the history and rows of the notes marked deleted, in batches of --batch-size history '
+        'entries per transaction, once or every --interval seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'NOTES_PURGE_BATCH_SIZE', 1000), help='history entries deleted per transaction')
+        parser.add_argument('--limit', type=int, default=None, help='maximum number of notes purged per run')
+        parser.add_argument('--interval', type=float, default=0, help='seconds between runs, run once if 0')
+
+    def handle(self, *args, **options):
+        while True:
+            notes, edits = purge_deleted_notes(options['batch_size'], options['limit'])
+            self.stdout.write(f'Purged {notes} deleted notes and {edits} history entries.')
+            if not options['interval']:
+                return
+            connection.close() # don't hold a connection while sleeping
+            time.sleep(options['interval'])
@@ -0,0 +1,35 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from notes.jobs import delete_finished_jobs, get_options, run_batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the jobs of the background queue (notes.jobs) on a pool of --threads threads, claiming '
+        'them in batches of --batch-size and polling for new jobs every --poll-interval seconds, '
+        'or until no job is due with --once.'
+    )
+
+    def add_arguments(self, parser):
+        options = get_options()
+        parser.add_argument('--threads', type=int, default=options['THREADS'], help='number of threads running jobs')
+        parser.add_argument('--batch-size', type=int, default=options['BATCH_SIZE'], help='jobs claimed at a time')
+        parser.add_argument('--poll-interval', type=float, default=options['POLL_INTERVAL'], help='seconds between polls when no job is due')
+        parser.add_argument('--once', action='store_true', help='stop when no job is due')
+
+    def handle(self, *args, **options):
+        ran = 0
+        with ThreadPoolExecutor(options['threads'], thread_name_prefix='notes-worker') as executor:
+            while True:
+                batch = run_batch(executor, options['batch_size'])
+                ran += batch
+                if batch:
+                    continue
+                delete_finished_jobs()
+                if options['once']:
+                    break
+                connection.close() # don't hold a connection while sleeping
+                time.sleep(options['poll_interval'])
+        self.stdout.write(f'Ran {ran} jobs.')
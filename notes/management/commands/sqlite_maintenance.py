@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from notes.sqlite import run_maintenance
+
+
+class Command(BaseCommand):
+    help = (
+        'Checkpoint the WAL file of the SQLite database and refresh the statistics of the query planner, '
+        'once or every --interval seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='alias of the database')
+        parser.add_argument('--checkpoint', default='TRUNCATE', choices=['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'], help='checkpoint mode')
+        parser.add_argument('--no-optimize', action='store_true', help='do not run PRAGMA optimize')
+        parser.add_argument('--interval', type=float, default=0, help='seconds between runs, run once if 0')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'The {options["database"]} database is not a SQLite database.')
+        while True:
+            busy, frames, checkpointed = run_maintenance(connection, options['checkpoint'], not options['no_optimize'])
+            self.stdout.write(f'Checkpoint {"incomplete (database busy)" if busy else "complete"}: {checkpointed} of {frames} WAL frames.')
+            if not options['interval']:
+                return
+            connection.close() # don't hold a connection while sleeping
+            time.sleep(options['interval'])
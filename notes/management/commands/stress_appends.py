@@ -0,0 +1,76 @@
+import threading
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from notes.history import replay_edits
+from notes.models import NeofiUser, Note, NoteEdit, NoteShare
+from notes.services import NoteAppendConflict, NoteNotExtended, append_to_note, delete_note, extend_note
+
+
+class Command(BaseCommand):
+    help = (
+        'Append to one note from many threads at once, through both the append and the update paths, '
+        'and check that no append is lost and that the version history matches the note.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='number of concurrent writers')
+        parser.add_argument('--appends', type=int, default=50, help='appends per writer')
+        parser.add_argument('--keep', action='store_true', help='keep the note and user created for the run')
+
+    def handle(self, *args, **options):
+        user = NeofiUser.objects.create_user(f'stress-{uuid.uuid4().hex}@example.com', 'stress')
+        note = Note.objects.create(owner=user, content='')
+        NoteShare.objects.create(note=note, user=user)
+        NoteEdit.objects.record_edit(note_id=note.id, edited_by=user, offset=0, appended_content='')
+        done = []
+        errors = []
+        lock = threading.Lock()
+
+        def writer(number):
+            try:
+                for index in range(options['appends']):
+                    token = f'[{number}:{index}]'
+                    while True:
+                        try:
+                            if index % 2: # read-modify-write path of PUT /notes/<id>/
+                                content = Note.objects.values_list('content', flat=True).get(id=note.id)
+                                extend_note(note.id, user, content + token)
+                            else: # PATCH /notes/<id>/append/
+                                append_to_note(note.id, user, token)
+                            break
+                        except (NoteAppendConflict, NoteNotExtended): # appended to since read, like a client read again and retry
+                            continue
+                        except OperationalError as error: # e.g. SQLite busy, nothing was written
+                            with lock:
+                                errors.append(str(error))
+                    with lock:
+                        done.append(token)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(number,)) for number in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        content = Note.objects.values_list('content', flat=True).get(id=note.id)
+        lost = [token for token in done if content.count(token) != 1]
+        edits = list(NoteEdit.objects.filter(note_id=note.id).order_by('edit_timestamp', 'id'))
+        versions_ok = [edit.version for edit in edits] == list(range(1, len(edits) + 1))
+        replayed = ''
+        for edit, previous_content, replayed in replay_edits(edits):
+            pass
+        if not options['keep']:
+            delete_note(note.id)
+            user.delete()
+
+        self.stdout.write(
+            f'{len(done)} appends by {options["threads"]} threads, {len(errors)} retried database errors, '
+            f'{len(lost)} lost, {len(edits) - 1} history entries, versions in order: {versions_ok}, '
+            f'history matches the note: {replayed == content}.'
+        )
+        if lost or len(edits) - 1 != len(done) or not versions_ok or replayed != content:
+            raise CommandError('Concurrent appends were lost or the version history does not match the note.')
+        self.stdout.write(self.style.SUCCESS('No append was lost.'))
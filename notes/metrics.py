@@ -0,0 +1,215 @@
+"""
+Per-request instrumentation: latency, database queries and response size per route (the url
+name of notes/urls.py), exposed in the Prometheus text format on /metrics/.
+
+notes.middleware.MetricsMiddleware times every request. The queries are counted by an execute
+wrapper installed on every database connection when it is created (see notes.signals), which
+reports to the request running in the current context, so that the queries made in threads by
+the async views (sync_to_async) are counted too. Streamed responses are measured until their
+last chunk is sent.
+The metrics are kept per process: with several workers, every worker exposes its own.
+
+Options (NOTES_METRICS):
+    - ENABLED: record the metrics
+    - BUCKETS: upper bounds in seconds of the latency histogram buckets
+    - SERVER_TIMING: add a Server-Timing header with the time spent in the database and in total
+    - SLOW_REQUEST_MS: log the requests slower than this (with their SQL) to the notes.slow_requests
+      logger, None to disable
+    - SLOW_REQUEST_MAX_QUERIES: maximum number of SQL statements logged per slow request
+    - TOKEN: if set, /metrics/ requires an Authorization: Bearer <TOKEN> header
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+from django.conf import settings
+
+_current_request = ContextVar('notes_request_metrics', default=None)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_options():
+    """
+    Returns the NOTES_METRICS options, with their defaults.
+    """
+    options = {
+        'ENABLED': True,
+        'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+        'SERVER_TIMING': False,
+        'SLOW_REQUEST_MS': 1000,
+        'SLOW_REQUEST_MAX_QUERIES': 50,
+        'TOKEN': None,
+    }
+    options.update(getattr(settings, 'NOTES_METRICS', {}))
+    return options
+
+
+class RequestMetrics:
+    """
+    Queries of the request being served, filled by record_query.
+    """
+
+    def __init__(self, keep_sql):
+        self.queries = 0
+        self.query_time = 0.0
+        self.keep_sql = keep_sql
+        self.statements = []
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.query_time += duration
+        if len(self.statements) < self.keep_sql:
+            self.statements.append((sql, duration))
+
+
+def begin_request(request_metrics):
+    """
+    Count the queries made in the current context in request_metrics.
+
+    Returns:
+        - token to pass to end_request().
+    """
+    return _current_request.set(request_metrics)
+
+
+def end_request(token):
+    """
+    Stop counting the queries made in the current context.
+    """
+    _current_request.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting the queries of the current request.
+    """
+    request_metrics = _current_request.get()
+    if request_metrics is None: # not in a request, e.g. a management command
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.add_query(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(connection):
+    """
+    Install record_query on a new database connection.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Registry:
+    """
+    Thread safe per route metrics of the process.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._routes = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, status_code, duration, queries, query_time, response_size):
+        with self._lock:
+            key = (route, method, str(status_code))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            metrics = self._routes.get(route)
+            if metrics is None:
+                metrics = self._routes[route] = {'buckets': [0] * len(self.buckets), 'count': 0, 'duration': 0.0, 'queries': 0, 'query_time': 0.0, 'response_bytes': 0}
+            for index, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    metrics['buckets'][index] += 1
+            metrics['count'] += 1
+            metrics['duration'] += duration
+            metrics['queries'] += queries
+            metrics['query_time'] += query_time
+            metrics['response_bytes'] += response_size
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._requests), {route: {**metrics, 'buckets': list(metrics['buckets'])} for route, metrics in self._routes.items()}
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+            self._requests.clear()
+
+
+def get_registry():
+    """
+    Returns the metrics registry of the process, creating it on first use.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = Registry(get_options()['BUCKETS'])
+    return _registry
+
+
+def _cache_stats():
+    from notes.access import get_access_cache
+    from notes.authentication import token_cache_stats
+    from notes.note_cache import note_cache_stats
+    return {'token': token_cache_stats(), 'access': get_access_cache().stats(), 'note': note_cache_stats()}
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def render_metrics():
+    """
+    Returns the metrics of the process in the Prometheus text exposition format.
+    """
+    registry = get_registry()
+    requests, routes = registry.snapshot()
+    lines = [
+        '# HELP notes_http_requests_total Requests served.',
+        '# TYPE notes_http_requests_total counter',
+    ]
+    for (route, method, status_code), count in sorted(requests.items()):
+        lines.append(f'notes_http_requests_total{{{_labels(route=route, method=method, status=status_code)}}} {count}')
+    lines += [
+        '# HELP notes_http_request_duration_seconds Time to the response, streamed bodies included.',
+        '# TYPE notes_http_request_duration_seconds histogram',
+    ]
+    for route, metrics in sorted(routes.items()):
+        for bound, count in zip(registry.buckets, metrics['buckets']):
+            lines.append(f'notes_http_request_duration_seconds_bucket{{{_labels(route=route, le=bound)}}} {count}')
+        lines.append(f'notes_http_request_duration_seconds_bucket{{{_labels(route=route, le="+Inf")}}} {metrics["count"]}')
+        lines.append(f'notes_http_request_duration_seconds_sum{{{_labels(route=route)}}} {metrics["duration"]}')
+        lines.append(f'notes_http_request_duration_seconds_count{{{_labels(route=route)}}} {metrics["count"]}')
+    for name, key, help_text in (
+        ('notes_db_queries_total', 'queries', 'Database queries made by the requests.'),
+        ('notes_db_query_duration_seconds_total', 'query_time', 'Time spent in database queries by the requests.'),
+        ('notes_http_response_bytes_total', 'response_bytes', 'Size of the response bodies.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for route, metrics in sorted(routes.items()):
+            lines.append(f'{name}{{{_labels(route=route)}}} {metrics[key]}')
+    lines += [
+        '# HELP notes_cache_lookups_total Lookups of the caches by result.',
+        '# TYPE notes_cache_lookups_total counter',
+    ]
+    cache_stats = _cache_stats()
+    for cache, stats in sorted(cache_stats.items()):
+        for result in ('hits', 'shared_hits', 'misses'):
+            if result in stats:
+                lines.append(f'notes_cache_lookups_total{{{_labels(cache=cache, result=result)}}} {stats[result]}')
+    lines += ['# HELP notes_cache_hit_ratio Share of the lookups of the caches served from the cache.', '# TYPE notes_cache_hit_ratio gauge']
+    for cache, stats in sorted(cache_stats.items()):
+        hits = stats['hits'] + stats.get('shared_hits', 0)
+        lookups = hits + stats['misses']
+        lines.append(f'notes_cache_hit_ratio{{{_labels(cache=cache)}}} {hits / lookups if lookups else 0}')
+    lines += ['# HELP notes_cache_entries Entries of the in-process caches.', '# TYPE notes_cache_entries gauge']
+    for cache, stats in sorted(cache_stats.items()):
+        if 'size' in stats: # the note cache is a Django cache
+            lines.append(f'notes_cache_entries{{{_labels(cache=cache)}}} {stats["size"]}')
+    return '\n'.join(lines) + '\n'
+
@@ -0,0 +1,161 @@
+"""
+Middleware of the notes app.
+"""
+
+import logging
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from notes.metrics import RequestMetrics, begin_request, end_request, get_options as get_metrics_options, get_registry
+from notes.routers import pin_to_primary
+
+slow_request_logger = logging.getLogger('notes.slow_requests')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pin the reads of a user to the primary database after a write request of theirs, so that
+    the views reading from the replica (see notes.routers) don't serve them stale data.
+
+    Supports both WSGI and ASGI, so that async views are not run in a thread under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _pin_writer(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 500:
+            return False
+        user = getattr(request, 'user', None) # set by DRF (or notes.async_views) to the user of the token
+        return user is not None and user.is_authenticated
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        if self._pin_writer(request, response):
+            pin_to_primary(request.user.id)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method not in SAFE_METHODS and await sync_to_async(self._pin_writer)(request, response): # request.user may be loaded lazily from the session
+            await sync_to_async(pin_to_primary)(request.user.id)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, queries and response size of every request per route (see notes.metrics),
+    until the last chunk of streamed responses, add the Server-Timing header and log the slow
+    requests. Must be the first middleware so that the time spent in the others is included.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.options = get_metrics_options()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.options['ENABLED']:
+            return self.get_response(request)
+        request_metrics = RequestMetrics(self._keep_sql())
+        start = time.perf_counter()
+        token = begin_request(request_metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self._finish(request, response, request_metrics, start)
+
+    async def __acall__(self, request):
+        if not self.options['ENABLED']:
+            return await self.get_response(request)
+        request_metrics = RequestMetrics(self._keep_sql())
+        start = time.perf_counter()
+        token = begin_request(request_metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self._finish(request, response, request_metrics, start)
+
+    def _keep_sql(self):
+        # the SQL is only kept when it may be logged
+        return self.options['SLOW_REQUEST_MAX_QUERIES'] if self.options['SLOW_REQUEST_MS'] is not None else 0
+
+    def _finish(self, request, response, request_metrics, start):
+        if self.options['SERVER_TIMING']: # sent before the body of a streamed response, so without its queries
+            response['Server-Timing'] = (
+                f'db;dur={request_metrics.query_time * 1000:.1f};desc="{request_metrics.queries} queries", '
+                f'total;dur={(time.perf_counter() - start) * 1000:.1f}'
+            )
+        if not response.streaming:
+            self._observe(request, response, request_metrics, start, len(response.content))
+        elif response.is_async:
+            response.streaming_content = self._astream(request, response, response.streaming_content, request_metrics, start)
+        else:
+            response.streaming_content = self._stream(request, response, response.streaming_content, request_metrics, start)
+        return response
+
+    def _stream(self, request, response, content, request_metrics, start):
+        # the queries made while generating the body are counted in the request
+        content = iter(content)
+        size = 0
+        try:
+            while True:
+                token = begin_request(request_metrics)
+                try:
+                    chunk = next(content, None)
+                finally:
+                    end_request(token)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._observe(request, response, request_metrics, start, size)
+
+    async def _astream(self, request, response, content, request_metrics, start):
+        content = aiter(content)
+        size = 0
+        try:
+            while True:
+                token = begin_request(request_metrics)
+                try:
+                    chunk = await anext(content, None)
+                finally:
+                    end_request(token)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._observe(request, response, request_metrics, start, size)
+
+    def _observe(self, request, response, request_metrics, start, response_size):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        route = match.url_name if match is not None and match.url_name else 'unmatched'
+        get_registry().observe(route, request.method, response.status_code, duration, request_metrics.queries, request_metrics.query_time, response_size)
+
+        slow_request_ms = self.options['SLOW_REQUEST_MS']
+        if slow_request_ms is not None and duration * 1000 >= slow_request_ms:
+            statements = ''.join(f'\n    [{query_time * 1000:.1f} ms] {sql}' for sql, query_time in request_metrics.statements)
+            slow_request_logger.warning(
+                'Slow request: %s %s (%s) %s in %.1f ms, %d queries in %.1f ms%s',
+                request.method, request.get_full_path(), route, response.status_code, duration * 1000,
+                request_metrics.queries, request_metrics.query_time * 1000, statements,
+            )
@@ -0,0 +1,96 @@
+# Generated by Django 5.0.2 on 2026-10-18 04:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def snapshot_interval():
+    return max(1, getattr(settings, 'NOTES_HISTORY_SNAPSHOT_INTERVAL', 50))
+
+
+def convert_to_deltas(apps, schema_editor):
+    """
+    Convert full previous_content/edited_content copies into appended suffixes and offsets.
+    """
+    NoteEdit = apps.get_model('notes', 'NoteEdit')
+    interval = snapshot_interval()
+    note_ids = NoteEdit.objects.values_list('note_id', flat=True).distinct()
+    for note_id in note_ids.iterator():
+        edits = NoteEdit.objects.filter(note_id=note_id).order_by('edit_timestamp', 'id')
+        for version, edit in enumerate(edits.iterator(), start=1):
+            edit.version = version
+            edit.offset = len(edit.previous_content)
+            if edit.edited_content.startswith(edit.previous_content):
+                edit.appended_content = edit.edited_content[edit.offset:]
+                edit.snapshot_content = edit.edited_content if version % interval == 0 else None
+            else: # not an append, keep the full content so that it can still be rebuilt
+                edit.appended_content = edit.edited_content
+                edit.snapshot_content = edit.edited_content
+            edit.save(update_fields=['version', 'offset', 'appended_content', 'snapshot_content'])
+
+
+def convert_to_full_copies(apps, schema_editor):
+    """
+    Rebuild full previous_content/edited_content copies from the stored deltas.
+    """
+    NoteEdit = apps.get_model('notes', 'NoteEdit')
+    note_ids = NoteEdit.objects.values_list('note_id', flat=True).distinct()
+    for note_id in note_ids.iterator():
+        content = ''
+        for edit in NoteEdit.objects.filter(note_id=note_id).order_by('edit_timestamp', 'id').iterator():
+            edit.previous_content = content[:edit.offset]
+            if edit.snapshot_content is not None:
+                content = edit.snapshot_content
+            else:
+                content = edit.previous_content + edit.appended_content
+            edit.edited_content = content
+            edit.save(update_fields=['previous_content', 'edited_content'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='noteedit',
+            name='appended_content',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='noteedit',
+            name='offset',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='noteedit',
+            name='snapshot_content',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='noteedit',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(convert_to_deltas, convert_to_full_copies),
+        migrations.AlterField(
+            model_name='noteedit',
+            name='edited_content',
+            field=models.TextField(default=''),
+        ),
+        migrations.AlterField(
+            model_name='noteedit',
+            name='previous_content',
+            field=models.TextField(default=''),
+        ),
+        migrations.RemoveField(
+            model_name='noteedit',
+            name='edited_content',
+        ),
+        migrations.RemoveField(
+            model_name='noteedit',
+            name='previous_content',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-18 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0002_noteedit_delta_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='noteedit',
+            index=models.Index(fields=['note', 'edit_timestamp', 'id'], name='notes_edit_note_ts_idx'),
+        ),
+    ]
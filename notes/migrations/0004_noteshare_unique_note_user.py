@@ -0,0 +1,28 @@
+# Generated by Django 5.0.2 on 2026-10-18 04:27
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_shares(apps, schema_editor):
+    """
+    Keep only the first share of every (note, user) pair so the unique constraint can be added.
+    """
+    NoteShare = apps.get_model('notes', 'NoteShare')
+    first_ids = NoteShare.objects.values('note_id', 'user_id').annotate(first_id=Min('id')).values('first_id')
+    NoteShare.objects.exclude(id__in=first_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0003_noteedit_note_ts_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_shares, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='noteshare',
+            constraint=models.UniqueConstraint(fields=('note', 'user'), name='notes_share_unique_note_user'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-18 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_noteshare_unique_note_user'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='noteshare',
+            name='notes_share_unique_note_user',
+        ),
+        migrations.AddConstraint(
+            model_name='noteshare',
+            constraint=models.UniqueConstraint(fields=('user', 'note'), name='notes_share_unique_user_note'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_noteshare_unique_user_note'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['updated_at', 'id'], name='notes_note_updated_idx'),
+        ),
+    ]
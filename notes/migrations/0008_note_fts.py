@@ -0,0 +1,30 @@
+# Generated by Django 5.0.2 on 2026-10-18 04:32
+
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    """
+    Create and fill the FTS5 full-text index of the notes on SQLite (see notes.search).
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS notes_note_fts USING fts5(content, note_id UNINDEXED)')
+    schema_editor.execute('INSERT INTO notes_note_fts (content, note_id) SELECT content, id FROM notes_note')
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS notes_note_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0007_note_change_feed'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-18 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_note_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='noteedit',
+            index=models.Index(fields=['note', 'version'], name='notes_edit_note_version_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-18 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0012_note_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notejob',
+            index=models.Index(fields=['note_id', 'id'], name='notes_job_note_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser
 
 class NeofiUserManager(BaseUserManager):
@@ -78,15 +80,37 @@ class NeofiUser(AbstractBaseUser):
     def is_staff(self):
         return self.is_admin
     
+class LiveNoteManager(models.Manager):
+    """
+    Manager of the notes which are not deleted.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Note(models.Model):
     """
     Model representing a note created by a user.
+
+    A deleted note is only marked deleted (deleted_at) and hidden by Note.objects, its history and
+    the note itself are removed later by purge_deleted_notes (notes.services). Note.all_objects
+    includes the deleted notes.
     """
 
     owner = models.ForeignKey(NeofiUser, on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = LiveNoteManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='notes_note_updated_idx'),
+        ]
 
     def __str__(self):
         """
@@ -100,6 +124,12 @@ class NoteShare(models.Model):
     """
     note = models.ForeignKey(Note, on_delete=models.CASCADE)
     user = models.ForeignKey(NeofiUser, on_delete=models.CASCADE)
+    shared_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'note'], name='notes_share_unique_user_note'),
+        ]
 
     def __str__(self):
         """
@@ -107,18 +137,155 @@ class NoteShare(models.Model):
         """
         return self.user.username + ' @ ' + str(self.note.updated_at)
 
+class ContentBlob(models.Model):
+    """
+    Model representing a compressed text, stored once per distinct text (content addressed by its sha256).
+
+    Large texts of the version history are stored as blobs when NOTES_CONTENT_STORAGE is enabled
+    (see notes.storage).
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    codec = models.CharField(max_length=8)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()
+    stored_size = models.PositiveIntegerField()
+
+    def __str__(self):
+        """
+        Returns a string representation of the blob.
+        """
+        return self.sha256 + ' (' + self.codec + ')'
+
+
+class NoteEditManager(models.Manager):
+    """
+    Custom manager for NoteEdit model.
+    """
+
+    def record_edit(self, note_id, edited_by, offset, appended_content, edited_content=None):
+        """
+        Creates and saves a delta edit for the note with the given id.
+
+        Only the appended suffix and the offset it was appended at are stored. Every
+        NOTES_HISTORY_SNAPSHOT_INTERVAL-th version also keeps a full snapshot of the
+        edited content so that history can be rebuilt without replaying from the start.
+        When edited_content is not given, it is only loaded from the note for snapshot versions.
+        """
+        last_version = self.filter(note_id=note_id).order_by('-version').values_list('version', flat=True).first() or 0
+        version = last_version + 1
+        snapshot_content = None
+        if version % snapshot_interval() == 0:
+            if edited_content is None:
+                edited_content = Note.objects.values_list('content', flat=True).get(id=note_id)
+            snapshot_content = edited_content
+        edit = self.model(
+            note_id=note_id,
+            edited_by=edited_by,
+            version=version,
+            offset=offset,
+            appended_content=appended_content,
+            snapshot_content=snapshot_content,
+        )
+        from notes.storage import save_edits
+        save_edits([edit]) # stores large texts as blobs if enabled
+        return edit
+
+
+def snapshot_interval():
+    """
+    Returns the number of versions between two full snapshots of a note's content.
+    """
+    return max(1, getattr(settings, 'NOTES_HISTORY_SNAPSHOT_INTERVAL', 50))
+
+
 class NoteEdit(models.Model):
     """
     Model representing an edit made to a note.
+
+    Notes can only be appended to, so an edit is stored as a delta: the text appended
+    (appended_content) and the length of the content it was appended to (offset).
+    The previous and edited content are rebuilt on demand (see notes.history).
+    A text stored as a blob is left empty in its column and read back with notes.storage.
     """
     note = models.ForeignKey(Note, on_delete=models.CASCADE)
     edited_by = models.ForeignKey(NeofiUser, on_delete=models.CASCADE)
-    previous_content = models.TextField()
-    edited_content = models.TextField()
+    version = models.PositiveIntegerField(default=0)
+    offset = models.PositiveIntegerField(default=0)
+    appended_content = models.TextField(blank=True, default='')
+    snapshot_content = models.TextField(null=True, blank=True)
+    appended_blob = models.ForeignKey(ContentBlob, null=True, blank=True, on_delete=models.PROTECT, related_name='+')
+    snapshot_blob = models.ForeignKey(ContentBlob, null=True, blank=True, on_delete=models.PROTECT, related_name='+')
     edit_timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = NoteEditManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['note', 'edit_timestamp', 'id'], name='notes_edit_note_ts_idx'),
+            models.Index(fields=['note', 'version'], name='notes_edit_note_version_idx'),
+        ]
+
     def __str__(self):
         """
         Returns a string representation of the note editing.
         """
-        return self.note.id
\ No newline at end of file
+        return str(self.note_id) + ' v' + str(self.version)
+
+
+class NoteTombstone(models.Model):
+    """
+    Model recording that a note shared with a user has been deleted, for the change feed.
+    """
+    note_id = models.BigIntegerField()
+    user = models.ForeignKey(NeofiUser, on_delete=models.CASCADE)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='notes_tombstone_user_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the note deletion.
+        """
+        return self.user.username + ' @ ' + str(self.deleted_at)
+
+
+class NoteJob(models.Model):
+    """
+    Model representing a job of the background queue (see notes.jobs), e.g. indexing the text
+    appended to a note.
+
+    The jobs of a note (note_id) are run in the order they were enqueued. A job with an
+    idempotency_key is only enqueued once.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=100)
+    note_id = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='notes_job_status_idx'),
+            models.Index(fields=['note_id', 'id'], name='notes_job_note_idx'), # earlier jobs of a note
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the job.
+        """
+        return self.kind + ' #' + str(self.id) + ' (' + self.status + ')'
@@ -0,0 +1,159 @@
+"""
+Cache of the note reads (GET /notes/<id>/), in the Django cache NOTES_NOTE_CACHE['CACHE_ALIAS'].
+
+Every cached note has two entries:
+    - notes:note:<id> holding the updated_at of its current version,
+    - notes:note:<id>:<updated_at> holding the NoteSerializer payload of that version.
+The writes (notes.services) move notes:note:<id> to the new version when they commit and delete it
+with the note, and the views updating or creating a note cache its payload (write-through). A read
+caching the version it loaded never moves notes:note:<id> back to an older version, so a read that
+raced a write doesn't hide it (short of both checking the current version at the same instant).
+
+A cached note is only served to a user it is known to be shared with (notes.access). With a cache
+shared by all the processes (e.g. Redis), cache hits make no query. With a cache kept in process
+(LocMemCache, the default), the writes of the other processes are not seen, so the current version
+is read from the database instead of notes:note:<id> (one query on the primary key, VALIDATE, on by
+default for such caches): the payload is still served from the cache, and a note updated or deleted
+by another process is never served stale.
+"""
+
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from notes.access import aaccessible_note_ids, accessible_note_ids
+from notes.conditional import EPOCH
+from notes.models import Note
+from notes.routers import reads_from_replica
+
+_hits = 0
+_misses = 0
+_stats_lock = threading.Lock()
+
+
+def get_options():
+    """
+    Returns the NOTES_NOTE_CACHE options, with their defaults.
+    """
+    options = {'ENABLED': False, 'CACHE_ALIAS': 'default', 'TIMEOUT': 60, 'VALIDATE': None}
+    options.update(getattr(settings, 'NOTES_NOTE_CACHE', {}))
+    return options
+
+
+def _validates(options):
+    """
+    Returns True if the version of the cached notes is read from the database (VALIDATE, by
+    default when the cache is kept in process).
+    """
+    if options['VALIDATE'] is None:
+        return isinstance(caches[options['CACHE_ALIAS']], LocMemCache)
+    return options['VALIDATE']
+
+
+def _current_version(note_id):
+    return Note.objects.filter(id=note_id).values_list('updated_at', flat=True) # deleted notes are not found
+
+
+def _version_key(note_id):
+    return f'notes:note:{note_id}'
+
+
+def _data_key(note_id, updated_at):
+    return f'notes:note:{note_id}:{(updated_at - EPOCH) // timedelta(microseconds=1)}'
+
+
+def _count(hit):
+    global _hits, _misses
+    with _stats_lock:
+        if hit:
+            _hits += 1
+        else:
+            _misses += 1
+
+
+def _note_id(note_id):
+    try:
+        return int(note_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_cached_note(user, note_id):
+    """
+    Returns the cached (updated_at, payload) of the current version of a note shared with the user,
+    or None if the note is not cached or not known to be shared with them.
+    """
+    options = get_options()
+    note_id = _note_id(note_id)
+    if not options['ENABLED'] or note_id is None or note_id not in accessible_note_ids(user.id):
+        return None
+    cache = caches[options['CACHE_ALIAS']]
+    updated_at = _current_version(note_id).first() if _validates(options) else cache.get(_version_key(note_id))
+    data = cache.get(_data_key(note_id, updated_at)) if updated_at is not None else None
+    _count(data is not None)
+    return (updated_at, data) if data is not None else None
+
+
+async def aget_cached_note(user, note_id):
+    """
+    Async version of get_cached_note.
+    """
+    options = get_options()
+    note_id = _note_id(note_id)
+    if not options['ENABLED'] or note_id is None or note_id not in await aaccessible_note_ids(user.id):
+        return None
+    cache = caches[options['CACHE_ALIAS']]
+    updated_at = await _current_version(note_id).afirst() if _validates(options) else await cache.aget(_version_key(note_id))
+    data = await cache.aget(_data_key(note_id, updated_at)) if updated_at is not None else None
+    _count(data is not None)
+    return (updated_at, data) if data is not None else None
+
+
+def cache_note(note_id, updated_at, data=None):
+    """
+    Record the version of a note read or written, with its payload if given (otherwise it is
+    cached by the next read). An older version than the cached one is not made current, and the
+    versions read from the replica are not cached.
+    """
+    options = get_options()
+    if not options['ENABLED'] or reads_from_replica(): # the replica may lag behind the primary
+        return
+    cache = caches[options['CACHE_ALIAS']]
+    if data is not None:
+        cache.set(_data_key(note_id, updated_at), dict(data), options['TIMEOUT'])
+    current = cache.get(_version_key(note_id))
+    if current is None or current <= updated_at:
+        cache.set(_version_key(note_id), updated_at, options['TIMEOUT'])
+
+
+async def acache_note(note_id, updated_at, data=None):
+    """
+    Async version of cache_note.
+    """
+    options = get_options()
+    if not options['ENABLED'] or reads_from_replica(): # the replica may lag behind the primary
+        return
+    cache = caches[options['CACHE_ALIAS']]
+    if data is not None:
+        await cache.aset(_data_key(note_id, updated_at), dict(data), options['TIMEOUT'])
+    current = await cache.aget(_version_key(note_id))
+    if current is None or current <= updated_at:
+        await cache.aset(_version_key(note_id), updated_at, options['TIMEOUT'])
+
+
+def invalidate_note(note_id):
+    """
+    Drop a note from the cache.
+    """
+    options = get_options()
+    if options['ENABLED']:
+        caches[options['CACHE_ALIAS']].delete(_version_key(note_id))
+
+
+def note_cache_stats():
+    """
+    Returns the hit and miss counters of the note cache in this process.
+    """
+    with _stats_lock:
+        return {'hits': _hits, 'misses': _misses}
@@ -0,0 +1,75 @@
+"""
+Helpers for keyset (cursor) pagination.
+
+A cursor is an opaque, url safe string encoding the sort key of the last row of a page.
+The next page is fetched with a WHERE (sort key) > (cursor) clause instead of an OFFSET,
+so every page costs the same regardless of how deep it is.
+"""
+
+import base64
+import json
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor cannot be decoded.
+    """
+
+
+def encode_cursor(*values):
+    """
+    Encode the sort key values (datetimes, numbers or strings) of a row into a cursor.
+    """
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Decode a cursor into a list of its size values.
+
+    Raises:
+        - InvalidCursor if the cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor.')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Invalid cursor.')
+    return values
+
+
+def decode_timestamp_cursor(cursor):
+    """
+    Decode a cursor of a (timestamp, id) sort key.
+
+    Returns:
+        - (datetime, int) tuple.
+
+    Raises:
+        - InvalidCursor if the cursor is malformed.
+    """
+    timestamp, pk = decode_cursor(cursor, 2)
+    try:
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor.')
+    if timestamp is None:
+        raise InvalidCursor('Invalid cursor.')
+    return timestamp, pk
+
+
+def get_page_size(request, default, maximum):
+    """
+    Read the page_size query parameter of the request, capped at maximum.
+
+    Raises:
+        - ValueError if page_size is not a positive integer.
+    """
+    page_size = int(request.query_params.get('page_size', default))
+    if page_size < 1:
+        raise ValueError('page_size must be a positive integer.')
+    return min(page_size, maximum)
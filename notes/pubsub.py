@@ -0,0 +1,151 @@
+"""
+Publish/subscribe of note events (appends) for the push channel (notes.views.note_events).
+
+Besides the appends ('created' and 'appended' events with a 'note' id), the changes of the
+accesses are published so that the subscribers keep the set of notes they may see up to date
+without querying the shares for every event: 'shared' events with the ids of the users given
+access to notes, and 'deleted' events with the 'note' id of a deleted note.
+
+The backend is chosen with the NOTES_PUBSUB_BACKEND setting (dotted path to a class). A backend
+provides:
+    - publish(event): send an event (a JSON serializable dict with a 'type') to all the subscribers,
+      may be called from any thread,
+    - subscribe(): return a subscription, to be called from the event loop consuming it.
+A subscription provides:
+    - async get(timeout): the next event, or None if there was none within timeout seconds,
+    - close(): stop receiving events.
+
+InProcessBroker fans events out within the process, which is enough for a single ASGI process
+and for local development. Deployments with several processes need a backend relaying events
+between them (e.g. over Redis pub/sub) implementing the same interface.
+"""
+
+import asyncio
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class InProcessSubscription:
+    """
+    Subscription to an InProcessBroker, buffering at most max_size events.
+
+    Events published while the buffer is full are dropped, a slow client should catch up
+    with the change feed.
+    """
+
+    def __init__(self, broker, max_size):
+        self._broker = broker
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(max_size)
+
+    def put(self, event):
+        """
+        Queue an event for the subscriber, from any thread.
+        """
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self, timeout):
+        """
+        Returns the next event, or None if there was none within timeout seconds.
+        """
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        """
+        Stop receiving events.
+        """
+        self._broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Broker fanning events out to the subscribers of the current process.
+    """
+
+    def __init__(self, max_queue_size=1000):
+        self.max_queue_size = max_queue_size
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event):
+        """
+        Send an event to all the subscribers.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.put(event)
+            except RuntimeError: # event loop of the subscriber is closed
+                self.unsubscribe(subscription)
+
+    def subscribe(self):
+        """
+        Returns a new subscription, must be called from the event loop consuming it.
+        """
+        subscription = InProcessSubscription(self, self.max_queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Remove a subscription.
+        """
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+
+def get_broker():
+    """
+    Returns the broker of the NOTES_PUBSUB_BACKEND setting, creating it on first use.
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'NOTES_PUBSUB_BACKEND', 'notes.pubsub.InProcessBroker'))()
+    return _broker
+
+
+def publish_edit(edit):
+    """
+    Publish a 'created' or 'appended' event for a saved NoteEdit.
+    """
+    get_broker().publish({
+        'type': 'created' if edit.version == 1 else 'appended',
+        'id': edit.id,
+        'note': edit.note_id,
+        'version': edit.version,
+        'offset': edit.offset,
+        'content': edit.appended_content,
+        'edited_by': edit.edited_by_id,
+        'timestamp': edit.edit_timestamp,
+    })
+
+
+def publish_shares(user_ids):
+    """
+    Publish a 'shared' event for users given access to notes.
+    """
+    get_broker().publish({'type': 'shared', 'users': list(user_ids)})
+
+
+def publish_deletion(note_id):
+    """
+    Publish a 'deleted' event for a deleted note.
+    """
+    get_broker().publish({'type': 'deleted', 'note': note_id})
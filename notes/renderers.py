@@ -0,0 +1,56 @@
+"""
+JSON renderer and parser backed by orjson when it is installed, falling back to the standard
+library (through the DRF JSONRenderer and JSONParser) otherwise.
+
+The output is the same JSON as the DRF JSONRenderer's (compact, UTF-8, datetimes in ISO 8601 with
+Z for UTC), so clients can't tell them apart. Enabled with the REST_FRAMEWORK setting.
+"""
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """
+    Returns data as JSON bytes, rendered like the DRF JSONRenderer.
+    """
+    if orjson is None:
+        return JSONRenderer().render(data)
+    # types orjson does not know (e.g. Decimal, lazy strings) are converted like the DRF encoder does
+    return orjson.dumps(data, default=_encoder.default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer rendering with orjson, unless an indented output is requested.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser parsing with orjson.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as error:
+            raise ParseError(f'JSON parse error - {error}')
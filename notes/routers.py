@@ -0,0 +1,97 @@
+"""
+Routing of the reads of the read-only views to a read replica (the 'replica' database, configured
+with DATABASE_REPLICA_URL).
+
+Reads go to the primary ('default') database unless they happen in a view decorated with
+replica_reads, so that the reads of a write path (e.g. checking a note before appending to it)
+never see a stale replica. Users who wrote within NOTES_REPLICA_PIN_SECONDS are served by the
+primary as well, so that they read their own writes despite the replication lag
+(see notes.middleware.ReadYourWritesMiddleware).
+"""
+
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+REPLICA = 'replica'
+
+_use_replica = ContextVar('notes_use_replica', default=False)
+
+
+class PrimaryReplicaRouter:
+    """
+    Database router sending the reads of replica_reads views to the replica, and everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True # the replica holds the same data as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None # a replica used for local testing can be migrated with migrate --database replica
+
+
+def _pin_key(user_id):
+    return f'notes:primary-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """
+    Serve the reads of the user from the primary for NOTES_REPLICA_PIN_SECONDS.
+    """
+    if REPLICA in connections:
+        caches[getattr(settings, 'NOTES_REPLICA_PIN_CACHE', 'default')].set(_pin_key(user_id), True, getattr(settings, 'NOTES_REPLICA_PIN_SECONDS', 5))
+
+
+def is_pinned_to_primary(user_id):
+    """
+    Returns True if the user wrote within NOTES_REPLICA_PIN_SECONDS.
+    """
+    return caches[getattr(settings, 'NOTES_REPLICA_PIN_CACHE', 'default')].get(_pin_key(user_id), False)
+
+
+def reads_from_replica():
+    """
+    Returns True if the reads of the current view are served by the replica.
+    """
+    return _use_replica.get() and REPLICA in connections
+
+
+def replica_reads(view):
+    """
+    Decorator of read-only views serving their reads from the replica, if one is configured and
+    the user has not written recently. Must be applied under the DRF decorators (or with
+    method_decorator on APIView methods) so that the user is authenticated. Works on async views too.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if REPLICA not in connections or await sync_to_async(is_pinned_to_primary)(request.user.id):
+                return await view(request, *args, **kwargs)
+            token = _use_replica.set(True) # copied to the threads running the queries
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if REPLICA not in connections or is_pinned_to_primary(request.user.id):
+            return view(request, *args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
@@ -0,0 +1,171 @@
+"""
+Full-text search over the content of the notes.
+
+Two engines are available:
+    - SQLiteFTSSearchEngine: SQLite FTS5 inverted index (notes_note_fts table, created by the
+      migrations on SQLite). Notes are append-only, so every append is indexed as its own row
+      and nothing is ever reindexed. A note matches if each word is in any of its appended chunks
+      (a word split over two appends is not found).
+    - FallbackSearchEngine: case insensitive substring match on Note.content, for other databases.
+
+The engine is chosen with the NOTES_SEARCH_ENGINE setting (dotted path to a class), by default
+FTS5 on SQLite and the fallback engine otherwise.
+
+Snippets are HTML: the text of the note is escaped and the matches are wrapped in <mark></mark>.
+"""
+
+import html
+import re
+import threading
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+from notes.models import Note
+
+FTS_TABLE = 'notes_note_fts'
+
+# control characters marking the matches in the FTS snippets until the text is escaped
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class SQLiteFTSSearchEngine:
+    """
+    Search engine backed by the SQLite FTS5 table notes_note_fts(content, note_id UNINDEXED).
+    Needs SQLite 3.35 or later.
+    """
+
+    snippet_tokens = 12
+
+    def index_append(self, note_id, text):
+        """
+        Index text appended to a note.
+        """
+        if not text:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (content, note_id) VALUES (%s, %s)', [text, note_id])
+
+    def index_appends(self, appends):
+        """
+        Index a list of (note_id, appended text) in one batch.
+        """
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (content, note_id) VALUES (%s, %s)', [(text, note_id) for note_id, text in appends if text])
+
+    def remove(self, note_id):
+        """
+        Remove a note from the index.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE note_id = %s', [note_id])
+
+    def search(self, user, query, offset, limit):
+        """
+        Returns the notes shared with the user matching all the words of query, best match first.
+
+        Returns:
+            - list of dicts with id, score (lower is better) and snippet of the notes.
+        """
+        words = query.split()
+        if not words:
+            return []
+        terms = ['"' + word.replace('"', '""') + '"' for word in words] # match the words literally
+        # a note matches if every word is in any of its chunks; the chunks matching any word give
+        # the score of the note (sum of their bm25 ranks, lower is better) and the best of them
+        # the snippet (SQLite takes the bare snippet column from the row with the MIN rank).
+        # The CTE is materialized because snippet() cannot be evaluated in an aggregate query.
+        every_word = ''.join(f' AND note_id IN (SELECT note_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)' for term in terms)
+        sql = f'''
+            WITH hits AS MATERIALIZED (
+                SELECT note_id, rank, snippet({FTS_TABLE}, 0, %s, %s, '…', %s) AS snippet
+                FROM {FTS_TABLE}
+                WHERE {FTS_TABLE} MATCH %s
+                AND note_id IN (SELECT note_id FROM notes_noteshare WHERE user_id = %s){every_word}
+            )
+            SELECT note_id, SUM(rank) AS score, MIN(rank), snippet FROM hits
+            GROUP BY note_id
+            ORDER BY score, note_id
+            LIMIT %s OFFSET %s
+        '''
+        params = [MATCH_START, MATCH_END, self.snippet_tokens, ' OR '.join(terms), user.id, *terms, limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [{'id': note_id, 'score': score, 'snippet': self.highlight(snippet)} for note_id, score, best_rank, snippet in cursor.fetchall()]
+
+    def highlight(self, snippet):
+        """
+        Returns the snippet escaped as HTML, with the matches marked by FTS5 in <mark></mark>.
+        """
+        return html.escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+class FallbackSearchEngine:
+    """
+    Search engine matching the words as case insensitive substrings of Note.content, most recently
+    updated notes first. Nothing needs to be indexed.
+    """
+
+    snippet_length = 80
+
+    def index_append(self, note_id, text):
+        pass
+
+    def index_appends(self, appends):
+        pass
+
+    def remove(self, note_id):
+        pass
+
+    def search(self, user, query, offset, limit):
+        """
+        Returns the notes shared with the user containing all the words of query.
+
+        Returns:
+            - list of dicts with id, score (number of occurrences, higher is better) and snippet of the notes.
+        """
+        words = query.split()
+        if not words:
+            return []
+        notes = Note.objects.filter(noteshare__user=user)
+        for word in words:
+            notes = notes.filter(content__icontains=word)
+        notes = notes.order_by('-updated_at', '-id').values_list('id', 'content')[offset:offset + limit]
+        pattern = re.compile('|'.join(re.escape(word) for word in words), re.IGNORECASE)
+        return [{'id': note_id, 'score': len(pattern.findall(content)), 'snippet': self.snippet(content, pattern)} for note_id, content in notes]
+
+    def snippet(self, content, pattern):
+        """
+        Returns the text around the first match of pattern in content, escaped as HTML, with the
+        matches in <mark></mark>.
+        """
+        match = pattern.search(content)
+        start = max(0, match.start() - self.snippet_length // 2) if match else 0
+        end = start + self.snippet_length
+        text, position = content[start:end], 0
+        parts = []
+        for found in pattern.finditer(text):
+            parts.append(html.escape(text[position:found.start()]) + '<mark>' + html.escape(found.group(0)) + '</mark>')
+            position = found.end()
+        parts.append(html.escape(text[position:]))
+        return ('…' if start > 0 else '') + ''.join(parts) + ('…' if end < len(content) else '')
+
+
+def get_search_engine():
+    """
+    Returns the search engine of the NOTES_SEARCH_ENGINE setting, creating it on first use.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine_class = getattr(settings, 'NOTES_SEARCH_ENGINE', None)
+                if engine_class is not None:
+                    _engine = import_string(engine_class)()
+                elif connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35) and FTS_TABLE in connection.introspection.table_names():
+                    _engine = SQLiteFTSSearchEngine()
+                else:
+                    _engine = FallbackSearchEngine()
+    return _engine
@@ -1,3 +1,4 @@
+from django.utils import timezone
 from rest_framework import serializers
 from notes.models import NeofiUser, Note, NoteEdit
 
@@ -44,8 +45,17 @@ class NeofiUserLoginSerializer(serializers.ModelSerializer):
 class NoteSerializer(serializers.ModelSerializer):
     """
     Serializer for Note model.
+
+    Takes an optional fields argument to only serialize a subset of the fields.
     """
 
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
     class Meta:
         model = Note
         fields = ['id', 'content', 'created_at', 'updated_at']
@@ -54,9 +64,60 @@ class NoteSerializer(serializers.ModelSerializer):
 class NoteEditSerializer(serializers.ModelSerializer):
     """
     Serializer for NoteEdit model.
+
+    previous_content and edited_content are not stored on NoteEdit, they are rebuilt
+    from the stored deltas (see notes.history.annotate_edits) before serializing.
     """
-    
+
+    previous_content = serializers.CharField(read_only=True)
+    edited_content = serializers.CharField(read_only=True)
+
     class Meta:
         model = NoteEdit
         fields = ['note', 'previous_content', 'edited_content', 'edited_by', 'edit_timestamp']
 
+
+class NoteAppendSerializer(serializers.Serializer):
+    """
+    Serializer for appending text to a note.
+    """
+
+    content = serializers.CharField(trim_whitespace=False)
+    expected_length = serializers.IntegerField(required=False, min_value=0)
+    updated_at = serializers.DateTimeField(required=False)
+
+
+def note_rows_data(rows, fields=None):
+    """
+    Read-only fast path of NoteSerializer(rows, many=True, fields=fields).data for Note values() rows,
+    without building model instances and serializer fields.
+
+    Datetimes are converted to the current time zone and left to the renderer, which formats them
+    like DateTimeField does (ISO 8601, Z for UTC).
+    """
+    fields = [field for field in NoteSerializer.Meta.fields if fields is None or field in fields] # in the serializer order
+    datetime_fields = [field for field in fields if field in ('created_at', 'updated_at')]
+    data = []
+    for row in rows:
+        item = {field: row[field] for field in fields}
+        for field in datetime_fields:
+            item[field] = timezone.localtime(item[field])
+        data.append(item)
+    return data
+
+
+def edit_rows_data(rows):
+    """
+    Read-only fast path of NoteEditSerializer for NoteEdit values() rows annotated with
+    previous_content and edited_content (see notes.history.annotate_rows).
+
+    Yields the serialized edits.
+    """
+    for row in rows:
+        yield {
+            'note': row['note_id'],
+            'previous_content': row['previous_content'],
+            'edited_content': row['edited_content'],
+            'edited_by': row['edited_by_id'],
+            'edit_timestamp': timezone.localtime(row['edit_timestamp']),
+        }
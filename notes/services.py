@@ -0,0 +1,361 @@
+"""
+Write operations on notes shared by the views, and the handlers of the jobs they enqueue (notes.jobs).
+"""
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Length
+from django.utils import timezone
+from notes.access import invalidate_access
+from notes.jobs import enqueue, enqueue_many, get_options as get_jobs_options, job_handler
+from notes.models import NeofiUser, Note, NoteEdit, NoteShare, NoteTombstone, snapshot_interval
+from notes.note_cache import cache_note, invalidate_note
+from notes.pubsub import publish_deletion, publish_edit, publish_shares
+from notes.search import get_search_engine
+from notes.serializers import NoteSerializer
+from notes.storage import delete_unused_blobs, save_edits
+
+
+class NoteAppendConflict(Exception):
+    """
+    Raised when a note was modified since the version the client expected.
+    """
+
+
+class NoteNotExtended(Exception):
+    """
+    Raised when the new content of a note does not start with its current content.
+    """
+
+
+class NoteShareDenied(Exception):
+    """
+    Raised when some of the notes to share are not owned by the sharing user (or do not exist).
+    """
+
+    def __init__(self, note_ids):
+        super().__init__(note_ids)
+        self.note_ids = note_ids
+
+
+class NoteShareUsersMissing(Exception):
+    """
+    Raised when some of the users to share notes with do not exist.
+    """
+
+    def __init__(self, user_ids):
+        super().__init__(user_ids)
+        self.user_ids = user_ids
+
+
+def append_to_note(note_id, user, appended_content, expected_length=None, expected_updated_at=None):
+    """
+    Append text to a note without loading its content.
+
+    The append is a single UPDATE ... SET content = content || %s, optionally guarded by the
+    expected content length and/or updated_at of the note (optimistic concurrency). The
+    history entry is written in the same transaction.
+
+    Returns:
+        - dict with id, length, updated_at and version of the note after the append.
+
+    Raises:
+        - NoteAppendConflict if the note does not match the expected length or updated_at.
+    """
+    with transaction.atomic():
+        notes = Note.objects.filter(id=note_id)
+        if expected_updated_at is not None:
+            notes = notes.filter(updated_at=expected_updated_at)
+        if expected_length is not None:
+            notes = notes.alias(content_length=Length('content')).filter(content_length=expected_length)
+        updated = notes.update(
+            content=Concat(F('content'), Value(appended_content), output_field=models.TextField()),
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            raise NoteAppendConflict()
+
+        # the row is locked by the update until the transaction ends, so the length read here is ours
+        note = Note.objects.annotate(length=Length('content')).values('id', 'length', 'updated_at').get(id=note_id)
+        edit = NoteEdit.objects.record_edit(
+            note_id=note_id,
+            edited_by=user,
+            offset=note['length'] - len(appended_content),
+            appended_content=appended_content,
+        )
+        index_appends([(note_id, appended_content)]) # index only the appended text
+        warm_note_cache(note_id)
+        transaction.on_commit(lambda: publish_edit(edit))
+    cache_note(note_id, note['updated_at']) # the content is cached by the next read
+    note['version'] = edit.version
+    return note
+
+
+def extend_note(note_id, user, content, expected_updated_at=None):
+    """
+    Replace the content of a note with content, which must start with the current content.
+
+    The note is updated with a conditional UPDATE ... WHERE updated_at = %s AND length(content) = %s
+    on the version that was read, retried up to NOTES_UPDATE_RETRIES times if another append won
+    the race, so concurrent appends are never lost and no lock is held while reading. The update
+    and its history entry are written in one transaction.
+
+    Returns:
+        - dict with id, length, updated_at and version of the note after the update.
+
+    Raises:
+        - Note.DoesNotExist if the note does not exist.
+        - NoteNotExtended if content does not start with the content of the note.
+        - NoteAppendConflict if the note does not match expected_updated_at, or has been appended
+          to concurrently with text that content does not extend.
+    """
+    retries = max(1, getattr(settings, 'NOTES_UPDATE_RETRIES', 5))
+    for attempt in range(retries):
+        note = Note.objects.values('content', 'updated_at').get(id=note_id)
+        if expected_updated_at is not None and note['updated_at'] != expected_updated_at:
+            raise NoteAppendConflict()
+        if not content.startswith(note['content']):
+            if attempt: # the note was appended to since our first read
+                raise NoteAppendConflict()
+            raise NoteNotExtended()
+
+        offset = len(note['content'])
+        with transaction.atomic(): # starts with the write, so the transaction never waits to upgrade a read lock
+            updated_at = timezone.now()
+            updated = (
+                Note.objects.filter(id=note_id, updated_at=note['updated_at'])
+                .alias(content_length=Length('content')).filter(content_length=offset)
+                .update(content=content, updated_at=updated_at)
+            )
+            if not updated: # appended to since it was read, try again on the new version
+                continue
+            edit = NoteEdit.objects.record_edit(
+                note_id=note_id,
+                edited_by=user,
+                offset=offset,
+                appended_content=content[offset:],
+                edited_content=content,
+            )
+            index_appends([(note_id, edit.appended_content)]) # index only the appended text
+            warm_note_cache(note_id)
+            transaction.on_commit(lambda: publish_edit(edit))
+        cache_note(note_id, updated_at)
+        return {'id': note_id, 'length': len(content), 'updated_at': updated_at, 'version': edit.version}
+    raise NoteAppendConflict()
+
+
+def _parse_ids(values):
+    """
+    Returns the deduplicated valid integer ids of a list of ids, in order.
+    """
+    ids = {}
+    for value in values:
+        try:
+            ids.setdefault(_parse_id(value), None)
+        except ValueError:
+            pass
+    return list(ids)
+
+
+def _parse_id(value):
+    """
+    Returns value as an integer id.
+
+    Raises:
+        - ValueError if value is not an integer id.
+    """
+    if isinstance(value, bool):
+        raise ValueError(value)
+    try:
+        return int(value)
+    except TypeError:
+        raise ValueError(value)
+
+
+def _missing_ids(values, found_ids):
+    """
+    Returns the values of a list of ids which are not valid ids or not in found_ids.
+    """
+    missing = []
+    for value in values:
+        try:
+            if _parse_id(value) in found_ids:
+                continue
+        except ValueError:
+            pass
+        missing.append(value)
+    return missing
+
+
+def share_notes(owner, note_ids, user_ids):
+    """
+    Share every note in note_ids with every user in user_ids.
+
+    All the notes and users are resolved with one query each, the already existing shares
+    with one more query and the missing ones are inserted in bulk, all in one transaction.
+    Nothing is shared unless all the notes are owned by owner and all the users exist.
+
+    Returns:
+        - number of shares created.
+
+    Raises:
+        - NoteShareDenied with the note ids not owned by owner.
+        - NoteShareUsersMissing with the user ids that do not exist.
+    """
+    requested_note_ids, requested_user_ids = note_ids, user_ids
+    note_ids, user_ids = _parse_ids(note_ids), _parse_ids(user_ids)
+    with transaction.atomic():
+        owned_note_ids = set(Note.objects.filter(id__in=note_ids, owner=owner).values_list('id', flat=True))
+        not_owned = _missing_ids(requested_note_ids, owned_note_ids)
+        if not_owned:
+            raise NoteShareDenied(not_owned)
+
+        existing_user_ids = set(NeofiUser.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        non_existent = _missing_ids(requested_user_ids, existing_user_ids)
+        if non_existent:
+            raise NoteShareUsersMissing(non_existent)
+
+        existing_shares = set(NoteShare.objects.filter(note_id__in=note_ids, user_id__in=user_ids).values_list('note_id', 'user_id'))
+        shares = [
+            NoteShare(note_id=note_id, user_id=user_id)
+            for note_id in note_ids
+            for user_id in user_ids
+            if (note_id, user_id) not in existing_shares
+        ]
+        # ignore_conflicts covers shares created concurrently since existing_shares was read
+        NoteShare.objects.bulk_create(shares, batch_size=getattr(settings, 'NOTES_BULK_BATCH_SIZE', 1000), ignore_conflicts=True)
+    invalidate_access(*user_ids)
+    transaction.on_commit(lambda: publish_shares(user_ids))
+    return len(shares)
+
+
+def delete_note(note_id):
+    """
+    Mark a note deleted and remove its shares, leaving a tombstone for every user it was shared with.
+
+    The note is hidden from every view at once, but its history (which can be long) is left to a
+    purge job, or to purge_deleted_notes when the jobs run inline, so the delete takes the same
+    time whatever the size of the history.
+    """
+    with transaction.atomic():
+        deleted = Note.objects.filter(id=note_id).update(deleted_at=timezone.now()) # starts with the write, so the transaction never waits to upgrade a read lock
+        if not deleted: # deleted concurrently
+            return
+        user_ids = list(NoteShare.objects.filter(note_id=note_id).values_list('user_id', flat=True))
+        NoteTombstone.objects.bulk_create([NoteTombstone(note_id=note_id, user_id=user_id) for user_id in user_ids], batch_size=getattr(settings, 'NOTES_BULK_BATCH_SIZE', 1000))
+        NoteShare.objects.filter(note_id=note_id).delete()
+        enqueue('purge_deleted_note', {'note_id': note_id}, idempotency_key=f'purge_deleted_note:{note_id}', background_only=True)
+    invalidate_access(*user_ids)
+    invalidate_note(note_id)
+    transaction.on_commit(lambda: publish_deletion(note_id))
+
+
+def purge_deleted_note(note_id, batch_size=None):
+    """
+    Remove the history, search index entries and row of a note marked deleted by delete_note.
+
+    The history is deleted in batches of batch_size (NOTES_PURGE_BATCH_SIZE by default) edits,
+    each in its own short transaction, so the purge never holds the write lock for long, together
+    with the blobs of their texts that no other edit shares.
+
+    Returns:
+        - number of history entries deleted.
+    """
+    batch_size = batch_size or getattr(settings, 'NOTES_PURGE_BATCH_SIZE', 1000)
+    if not Note.all_objects.filter(id=note_id, deleted_at__isnull=False).exists(): # not deleted, or already purged
+        return 0
+    purged = 0
+    while True:
+        edits = list(NoteEdit.objects.filter(note_id=note_id).values_list('id', 'appended_blob_id', 'snapshot_blob_id')[:batch_size])
+        if not edits:
+            break
+        with transaction.atomic():
+            purged += NoteEdit.objects.filter(id__in=[edit[0] for edit in edits]).delete()[0]
+            delete_unused_blobs({blob_id for edit in edits for blob_id in edit[1:] if blob_id is not None})
+    with transaction.atomic():
+        get_search_engine().remove(note_id)
+        Note.all_objects.filter(id=note_id, deleted_at__isnull=False).delete() # and the shares created concurrently with the delete
+    return purged
+
+
+def purge_deleted_notes(batch_size=None, limit=None):
+    """
+    Purge the notes marked deleted (at most limit of them), oldest deletion first.
+
+    Returns:
+        - (number of notes, number of history entries) purged.
+    """
+    note_ids = list(Note.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at', 'id').values_list('id', flat=True)[:limit])
+    return len(note_ids), sum(purge_deleted_note(note_id, batch_size) for note_id in note_ids)
+
+
+def create_notes_in_bulk(owner, contents):
+    """
+    Create a note for every content, with its owner share and first history entry.
+
+    The notes, shares and history entries are each inserted with bulk_create (in batches of
+    NOTES_BULK_BATCH_SIZE rows) in one transaction.
+
+    Returns:
+        - list of the ids of the created notes, in the order of contents.
+    """
+    batch_size = getattr(settings, 'NOTES_BULK_BATCH_SIZE', 1000)
+    with transaction.atomic():
+        notes = [Note(owner=owner, content=content) for content in contents]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Note.objects.bulk_create(notes, batch_size=batch_size)
+        else: # the ids of the notes would not be set by bulk_create
+            for note in notes:
+                note.save()
+        NoteShare.objects.bulk_create([NoteShare(note=note, user=owner) for note in notes], batch_size=batch_size)
+        keep_snapshot = snapshot_interval() == 1
+        edits = [
+            NoteEdit(
+                note=note,
+                edited_by=owner,
+                version=1,
+                offset=0,
+                appended_content=note.content,
+                snapshot_content=note.content if keep_snapshot else None,
+            )
+            for note in notes
+        ]
+        save_edits(edits, batch_size)
+        index_appends([(note.id, note.content) for note in notes])
+        transaction.on_commit(lambda: [publish_edit(edit) for edit in edits])
+    invalidate_access(owner.id)
+    return [note.id for note in notes]
+
+
+def index_appends(appends):
+    """
+    Index a list of (note_id, appended text) for the search, by an index_appends job.
+    """
+    enqueue_many('index_appends', [{'note_id': note_id, 'content': text} for note_id, text in appends if text])
+
+
+def warm_note_cache(note_id):
+    """
+    Cache the current version of a note with a warm_note_cache job, if enabled by
+    NOTES_JOBS['WARM_NOTE_CACHE'] (only useful when the note cache is shared with the worker).
+    """
+    if get_jobs_options()['WARM_NOTE_CACHE']:
+        enqueue('warm_note_cache', {'note_id': note_id}, background_only=True)
+
+
+@job_handler('index_appends')
+def run_index_appends(payloads):
+    get_search_engine().index_appends([(payload['note_id'], payload['content']) for payload in payloads])
+
+
+@job_handler('purge_deleted_note', atomic=False) # deletes the history in short transactions
+def run_purge_deleted_note(payloads):
+    for payload in payloads:
+        purge_deleted_note(payload['note_id'])
+
+
+@job_handler('warm_note_cache')
+def run_warm_note_cache(payloads):
+    for note in Note.objects.filter(id__in=[payload['note_id'] for payload in payloads]):
+        cache_note(note.id, note.updated_at, NoteSerializer(note).data)
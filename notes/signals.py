@@ -0,0 +1,48 @@
+"""
+Signal receivers of the notes app, connected in NotesConfig.ready().
+"""
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from notes.authentication import invalidate_token
+from notes.metrics import install_query_recorder
+from notes.models import NeofiUser
+from notes.sqlite import configure_connection
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """
+    Drop a saved or deleted token from the token cache.
+    """
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=NeofiUser)
+def invalidate_cached_user_tokens(sender, instance, created, **kwargs):
+    """
+    Drop the tokens of a saved user (e.g. deactivated) from the token cache.
+    """
+    if created:
+        return
+    for key in Token.objects.filter(user_id=instance.id).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    """
+    Run the PRAGMA statements of NOTES_SQLITE on a new SQLite connection.
+    """
+    configure_connection(connection)
+
+
+@receiver(connection_created)
+def record_connection_queries(sender, connection, **kwargs):
+    """
+    Count the queries of a new database connection in the metrics of the requests.
+    """
+    install_query_recorder(connection)
@@ -0,0 +1,65 @@
+"""
+Tuning of the SQLite connections (NOTES_SQLITE), for running on SQLite with concurrent writers
+(e.g. several gunicorn workers).
+
+When NOTES_SQLITE['ENABLED'] is set, every new SQLite connection runs:
+    - journal_mode=WAL: readers don't block the writer and the writer doesn't block the readers,
+    - synchronous=NORMAL: no fsync on every commit in WAL mode (a power loss may lose the last
+      commits but doesn't corrupt the database),
+    - busy_timeout: milliseconds a connection waits for the write lock before failing with
+      'database is locked',
+    - mmap_size and cache_size: bytes of memory mapped I/O and pages (KiB if negative) of the page cache.
+The WAL file is checkpointed and the query planner statistics are refreshed by
+python manage.py sqlite_maintenance (once, or every --interval seconds).
+"""
+
+from django.conf import settings
+
+PRAGMAS = (
+    ('JOURNAL_MODE', 'journal_mode'),
+    ('SYNCHRONOUS', 'synchronous'),
+    ('BUSY_TIMEOUT', 'busy_timeout'),
+    ('MMAP_SIZE', 'mmap_size'),
+    ('CACHE_SIZE', 'cache_size'),
+)
+
+
+def get_options():
+    """
+    Returns the NOTES_SQLITE options, with their defaults.
+    """
+    options = {'ENABLED': False, 'JOURNAL_MODE': 'WAL', 'SYNCHRONOUS': 'NORMAL', 'BUSY_TIMEOUT': 5000, 'MMAP_SIZE': 268435456, 'CACHE_SIZE': -64000}
+    options.update(getattr(settings, 'NOTES_SQLITE', {}))
+    return options
+
+
+def configure_connection(connection, options=None):
+    """
+    Run the PRAGMA statements of the options on a new SQLite connection, if the tuning is enabled.
+    Options set to None are left to the SQLite defaults.
+
+    The statements are run on the database driver connection, like the ones of the SQLite backend,
+    so they are not counted as queries of the request that opened the connection (see notes.metrics).
+    """
+    options = options or get_options()
+    if connection.vendor != 'sqlite' or not options['ENABLED']:
+        return
+    for option, pragma in PRAGMAS:
+        if options[option] is not None:
+            connection.connection.execute(f'PRAGMA {pragma} = {options[option]}')
+
+
+def run_maintenance(connection, checkpoint='TRUNCATE', optimize=True):
+    """
+    Checkpoint the WAL file of a SQLite database (PASSIVE, FULL, RESTART or TRUNCATE) and
+    refresh the statistics of the query planner if optimize is True.
+
+    Returns:
+        - (busy, WAL frames, frames checkpointed) of the checkpoint, busy is 1 if it could not complete.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA wal_checkpoint({checkpoint})')
+        result = tuple(cursor.fetchone())
+        if optimize:
+            cursor.execute('PRAGMA optimize')
+    return result
@@ -0,0 +1,204 @@
+"""
+Content addressed, compressed storage of the large texts of the version history.
+
+When NOTES_CONTENT_STORAGE['ENABLED'] is set, the appended text and the snapshot of a NoteEdit
+that are at least MIN_SIZE characters long are stored as a ContentBlob instead: compressed with
+CODEC (zlib, or zstd if the zstandard package is installed) and stored once per distinct text.
+The column of the text is left empty ('' and not NULL for snapshots, so that snapshot lookups
+keep working) and the text is read back with resolve_edits / resolve_rows, with one query per
+chunk of edits. Blobs are never updated, the codec of every blob is stored with it. The blobs of
+the purged edits are deleted once no edit references them (delete_unused_blobs).
+
+Note.content is kept as a plain column: appends concatenate it in SQL, and the listing, search
+and change feed read it directly.
+"""
+
+import hashlib
+import zlib
+from itertools import islice
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from notes.models import ContentBlob, NoteEdit
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# (text field, blob id field) of NoteEdit
+TEXT_FIELDS = (('appended_content', 'appended_blob_id'), ('snapshot_content', 'snapshot_blob_id'))
+
+
+def get_options():
+    """
+    Returns the NOTES_CONTENT_STORAGE options, with their defaults.
+    """
+    options = {'ENABLED': False, 'CODEC': 'zlib', 'MIN_SIZE': 1024}
+    options.update(getattr(settings, 'NOTES_CONTENT_STORAGE', {}))
+    return options
+
+
+def compress(text, codec):
+    """
+    Returns text compressed with codec ('zlib' or 'zstd').
+    """
+    data = text.encode()
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImproperlyConfigured('The zstd codec of NOTES_CONTENT_STORAGE needs the zstandard package.')
+        return zstandard.ZstdCompressor().compress(data)
+    if codec == 'zlib':
+        return zlib.compress(data)
+    raise ImproperlyConfigured(f'Unknown NOTES_CONTENT_STORAGE codec {codec}.')
+
+
+def decompress(codec, data):
+    """
+    Returns the text of data compressed with codec.
+    """
+    data = bytes(data) # some databases return a memoryview
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data).decode()
+    return zlib.decompress(data).decode()
+
+
+def store_texts(texts, codec=None):
+    """
+    Store texts as blobs, reusing the blobs of the texts already stored.
+
+    Returns:
+        - dict of text -> id of its blob.
+    """
+    codec = codec or get_options()['CODEC']
+    hashes = {hashlib.sha256(text.encode()).hexdigest(): text for text in texts}
+    blob_ids = {}
+    for sha256s in _chunks(hashes, 500): # stay below the query parameter limit of the database
+        blob_ids.update(ContentBlob.objects.filter(sha256__in=sha256s).values_list('sha256', 'id'))
+    missing = [sha256 for sha256 in hashes if sha256 not in blob_ids]
+    blobs = []
+    for sha256 in missing:
+        data = compress(hashes[sha256], codec)
+        blobs.append(ContentBlob(sha256=sha256, codec=codec, data=data, size=len(hashes[sha256].encode()), stored_size=len(data)))
+    ContentBlob.objects.bulk_create(blobs, batch_size=500, ignore_conflicts=True) # may be stored concurrently
+    for sha256s in _chunks(missing, 500):
+        blob_ids.update(ContentBlob.objects.filter(sha256__in=sha256s).values_list('sha256', 'id'))
+    return {text: blob_ids[sha256] for sha256, text in hashes.items()}
+
+
+def load_texts(blob_ids):
+    """
+    Returns a dict of blob id -> text of the blobs.
+    """
+    texts = {}
+    for ids in _chunks(blob_ids, 500):
+        for blob_id, codec, data in ContentBlob.objects.filter(id__in=ids).values_list('id', 'codec', 'data'):
+            texts[blob_id] = decompress(codec, data)
+    return texts
+
+
+def delete_unused_blobs(blob_ids):
+    """
+    Delete the blobs out of blob_ids (e.g. of deleted edits) that no edit references anymore.
+
+    Returns:
+        - number of blobs deleted.
+    """
+    deleted = 0
+    for ids in _chunks(blob_ids, 500):
+        referenced = NoteEdit.objects.filter(Q(appended_blob_id=OuterRef('id')) | Q(snapshot_blob_id=OuterRef('id')))
+        deleted += ContentBlob.objects.filter(id__in=ids).exclude(Exists(referenced)).delete()[0]
+    return deleted
+
+
+def externalize(edits, min_size, codec=None):
+    """
+    Move the texts of the edits at least min_size characters long (and not stored as blobs yet)
+    to blobs, on the objects only.
+
+    Returns:
+        - list of (edit, {text field: text}) of the texts moved.
+    """
+    texts = []
+    for edit in edits:
+        for field, blob_field in TEXT_FIELDS:
+            text = getattr(edit, field)
+            if text and len(text) >= min_size and getattr(edit, blob_field) is None:
+                texts.append(text)
+    if not texts:
+        return []
+    blob_ids = store_texts(texts, codec)
+    moved = []
+    for edit in edits:
+        edit_texts = {}
+        for field, blob_field in TEXT_FIELDS:
+            text = getattr(edit, field)
+            if text in blob_ids and getattr(edit, blob_field) is None:
+                setattr(edit, blob_field, blob_ids[text])
+                setattr(edit, field, '')
+                edit_texts[field] = text
+        if edit_texts:
+            moved.append((edit, edit_texts))
+    return moved
+
+
+def save_edits(edits, batch_size=None):
+    """
+    Insert new NoteEdit objects (with bulk_create in batches of batch_size), storing their large
+    texts as blobs if NOTES_CONTENT_STORAGE is enabled. The objects keep their texts.
+    """
+    options = get_options()
+    moved = externalize(edits, options['MIN_SIZE'], options['CODEC']) if options['ENABLED'] else []
+    if len(edits) == 1 or not connection.features.can_return_rows_from_bulk_insert:
+        for edit in edits: # the ids would not be set by bulk_create
+            edit.save()
+    else:
+        NoteEdit.objects.bulk_create(edits, batch_size=batch_size or getattr(settings, 'NOTES_BULK_BATCH_SIZE', 1000))
+    for edit, texts in moved:
+        for field, text in texts.items():
+            setattr(edit, field, text)
+
+
+def resolve_edits(edits, chunk_size=500):
+    """
+    Yields the NoteEdit objects with the texts stored as blobs read back, loading the blobs of
+    every chunk_size edits in one query. The blob id fields must not be deferred.
+    """
+    edits = iter(edits)
+    while True:
+        chunk = list(islice(edits, chunk_size))
+        if not chunk:
+            return
+        texts = load_texts({getattr(edit, blob_field) for edit in chunk for field, blob_field in TEXT_FIELDS} - {None})
+        for edit in chunk:
+            for field, blob_field in TEXT_FIELDS:
+                blob_id = getattr(edit, blob_field)
+                if blob_id is not None:
+                    setattr(edit, field, texts[blob_id])
+            yield edit
+
+
+def resolve_rows(rows, chunk_size=500):
+    """
+    Yields NoteEdit values() rows with the texts stored as blobs read back, for the rows
+    including the blob id fields (e.g. values('appended_content', 'appended_blob_id')).
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        texts = load_texts({row.get(blob_field) for row in chunk for field, blob_field in TEXT_FIELDS} - {None})
+        for row in chunk:
+            for field, blob_field in TEXT_FIELDS:
+                blob_id = row.pop(blob_field, None)
+                if blob_id is not None:
+                    row[field] = texts[blob_id]
+            yield row
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,340 @@
+"""
+Streaming export and import of the notes of a user, with their history and shares, as NDJSON.
+
+Every line is a JSON record with a type:
+    - note: id, content, created_at, updated_at
+    - edit: note (id of the note in the export), edited_by (email), version, offset,
+      appended_content, snapshot_content, edit_timestamp
+    - share: note (id of the note in the export), user (email), shared_at
+Notes are exported in chunks, each chunk followed by the edits and shares of its notes. The
+export reads with chunked iterators and the import writes with batched bulk_create, so the
+memory used does not depend on the number of notes.
+
+An uploaded import is first spooled to a temporary file (spool_import), within the NOTES_IMPORT
+limits, so that the import transaction never waits for a slow client.
+"""
+
+import gzip
+import json
+import tempfile
+import zlib
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+from notes.access import invalidate_access
+from notes.models import NeofiUser, Note, NoteEdit, NoteShare
+from notes.pubsub import publish_shares
+from notes.services import index_appends
+from notes.storage import resolve_rows, save_edits
+
+
+class NoteImportError(ValueError):
+    """
+    Raised when a line of an import is not a valid record.
+    """
+
+    def __init__(self, line_number, message):
+        super().__init__(f'Line {line_number}: {message}')
+        self.line_number = line_number
+
+
+class NoteImportTooLarge(ValueError):
+    """
+    Raised when an import is over the NOTES_IMPORT limits.
+    """
+
+
+def get_import_options():
+    """
+    Returns the NOTES_IMPORT options, with their defaults.
+    """
+    options = {
+        'MAX_BYTES': 100 * 1024 * 1024, # of the uncompressed export
+        'MAX_RECORDS': 1000000,
+        'SPOOL_MEMORY': 1024 * 1024, # spooled in memory up to this size, then to a file
+    }
+    options.update(getattr(settings, 'NOTES_IMPORT', {}))
+    return options
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_records(owner, chunk_size=None):
+    """
+    Yields the export records of the notes owned by owner, their edits and their shares.
+    """
+    chunk_size = chunk_size or getattr(settings, 'NOTES_BULK_BATCH_SIZE', 1000)
+    notes = Note.objects.filter(owner=owner).order_by('id').values('id', 'content', 'created_at', 'updated_at')
+    for chunk in _chunks(notes.iterator(chunk_size=chunk_size), chunk_size):
+        note_ids = [note['id'] for note in chunk]
+        for note in chunk:
+            yield {'type': 'note', **note}
+        edits = (
+            NoteEdit.objects.filter(note_id__in=note_ids)
+            .order_by('note_id', 'edit_timestamp', 'id')
+            .values('note_id', 'edited_by__email', 'version', 'offset', 'appended_content', 'snapshot_content', 'appended_blob_id', 'snapshot_blob_id', 'edit_timestamp')
+        )
+        for edit in resolve_rows(edits.iterator(chunk_size=chunk_size)): # the export has the texts stored as blobs inline
+            yield {
+                'type': 'edit',
+                'note': edit['note_id'],
+                'edited_by': edit['edited_by__email'],
+                'version': edit['version'],
+                'offset': edit['offset'],
+                'appended_content': edit['appended_content'],
+                'snapshot_content': edit['snapshot_content'],
+                'edit_timestamp': edit['edit_timestamp'],
+            }
+        shares = (
+            NoteShare.objects.filter(note_id__in=note_ids)
+            .exclude(user=owner) # the owner share is implied by the note
+            .order_by('id')
+            .values('note_id', 'user__email', 'shared_at')
+        )
+        for share in shares.iterator(chunk_size=chunk_size):
+            yield {'type': 'share', 'note': share['note_id'], 'user': share['user__email'], 'shared_at': share['shared_at']}
+
+
+def export_ndjson(owner, compress=False):
+    """
+    Yields the export of the notes owned by owner as NDJSON bytes, gzip compressed if compress is True.
+    """
+    encoder = JSONEncoder(ensure_ascii=False)
+    compressor = zlib.compressobj(wbits=31) if compress else None # wbits=31 writes a gzip container
+    for record in export_records(owner):
+        line = (encoder.encode(record) + '\n').encode()
+        if compressor is None:
+            yield line
+            continue
+        data = compressor.compress(line)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def read_ndjson(stream, compressed=False):
+    """
+    Yields the (line number, record) of an NDJSON byte stream, gzip compressed if compressed is True.
+
+    Raises:
+        - NoteImportError if a line is not a JSON object.
+    """
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream)
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise NoteImportError(line_number, 'not valid JSON.')
+        if not isinstance(record, dict):
+            raise NoteImportError(line_number, 'not a JSON object.')
+        yield line_number, record
+
+
+def spool_import(stream, compressed=False, chunk_size=64 * 1024):
+    """
+    Copy an NDJSON byte stream, gunzipped if compressed is True, to a temporary file.
+
+    Returns:
+        - the temporary file, positioned at its start, to be closed by the caller.
+
+    Raises:
+        - NoteImportTooLarge if the export is over MAX_BYTES or has more than MAX_RECORDS lines.
+        - OSError or EOFError if the gzip data is not valid.
+    """
+    options = get_import_options()
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream)
+    spool = tempfile.SpooledTemporaryFile(max_size=options['SPOOL_MEMORY'])
+    size = lines = 0
+    try:
+        while chunk := stream.read(chunk_size):
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+            if size > options['MAX_BYTES']:
+                raise NoteImportTooLarge(f"The export is larger than {options['MAX_BYTES']} bytes.")
+            if lines > options['MAX_RECORDS']:
+                raise NoteImportTooLarge(f"The export has more than {options['MAX_RECORDS']} records.")
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _timestamp(record, field, line_number):
+    value = record.get(field)
+    timestamp = parse_datetime(value) if isinstance(value, str) else None
+    if timestamp is None:
+        raise NoteImportError(line_number, f'{field} is not a valid timestamp.')
+    return timestamp
+
+
+def _check_note_reference(record, field, line_number):
+    if not isinstance(record.get(field), (int, str)) or isinstance(record.get(field), bool):
+        raise NoteImportError(line_number, f'{field} is not a valid note id.')
+
+
+def _check_edit(record, line_number):
+    """
+    Raises NoteImportError if the fields of an edit record don't have the exported types.
+    """
+    _check_note_reference(record, 'note', line_number)
+    for field in ('version', 'offset'):
+        value = record.get(field)
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise NoteImportError(line_number, f'{field} is not a non-negative integer.')
+    if not isinstance(record.get('appended_content'), str):
+        raise NoteImportError(line_number, 'appended_content is not a string.')
+    if not isinstance(record.get('snapshot_content'), (str, type(None))):
+        raise NoteImportError(line_number, 'snapshot_content is not a string or null.')
+
+
+class _Importer:
+    """
+    Imports records for one owner, keeping at most one batch of rows and the id mapping of the
+    current chunk of notes in memory.
+    """
+
+    def __init__(self, owner, batch_size):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.note_ids = {} # exported note id -> imported note id, for the current chunk
+        self.notes = []
+        self.edits = []
+        self.shares = []
+        self.last_type = None
+        self.shared_user_ids = set()
+        self.counts = {'notes': 0, 'edits': 0, 'shares': 0, 'skipped': 0}
+
+    def add(self, line_number, record):
+        record_type = record.get('type')
+        try:
+            if record_type == 'note':
+                if self.last_type not in (None, 'note'): # a new chunk of notes starts
+                    self.flush()
+                    self.note_ids = {}
+                content = record['content']
+                if not isinstance(content, str):
+                    raise NoteImportError(line_number, 'content is not a string.')
+                _check_note_reference(record, 'id', line_number)
+                note = Note(owner=self.owner, content=content)
+                note.imported_timestamps = (_timestamp(record, 'created_at', line_number), _timestamp(record, 'updated_at', line_number))
+                self.note_ids[record['id']] = note
+                self.notes.append(note)
+            elif record_type == 'edit':
+                _check_edit(record, line_number)
+                self.edits.append((line_number, record))
+            elif record_type == 'share':
+                _check_note_reference(record, 'note', line_number)
+                if not isinstance(record.get('user'), str):
+                    raise NoteImportError(line_number, 'user is not an email.')
+                self.shares.append((line_number, record))
+            else:
+                raise NoteImportError(line_number, 'type must be note, edit or share.')
+        except (KeyError, TypeError):
+            raise NoteImportError(line_number, f'not a valid {record_type} record.')
+        self.last_type = record_type
+        if len(self.notes) + len(self.edits) + len(self.shares) >= self.batch_size:
+            self.flush()
+
+    def _create(self, objs):
+        if connection.features.can_return_rows_from_bulk_insert:
+            type(objs[0]).objects.bulk_create(objs, batch_size=self.batch_size)
+        else: # the ids would not be set by bulk_create
+            for obj in objs:
+                obj.save()
+
+    def _users(self, emails):
+        return dict(NeofiUser.objects.filter(email__in=set(emails)).values_list('email', 'id'))
+
+    def flush(self):
+        if self.notes:
+            self._create(self.notes)
+            for note in self.notes: # auto_now(_add) overwrote the exported timestamps
+                note.created_at, note.updated_at = note.imported_timestamps
+            Note.objects.bulk_update(self.notes, ['created_at', 'updated_at'], batch_size=self.batch_size)
+            NoteShare.objects.bulk_create([NoteShare(note=note, user=self.owner) for note in self.notes], batch_size=self.batch_size, ignore_conflicts=True)
+            index_appends([(note.id, note.content) for note in self.notes])
+            for exported_id, note in self.note_ids.items():
+                if isinstance(note, Note):
+                    self.note_ids[exported_id] = note.id
+            self.counts['notes'] += len(self.notes)
+            self.notes = []
+
+        if self.edits:
+            edits = []
+            for line_number, record in self.edits:
+                note_id = self.note_ids.get(record.get('note'))
+                if note_id is None: # not one of the notes of the current chunk
+                    self.counts['skipped'] += 1
+                    continue
+                edit = NoteEdit( # the fields were checked by add
+                    note_id=note_id,
+                    edited_by_id=self.owner.id, # the exported authors are not trusted
+                    version=record['version'],
+                    offset=record['offset'],
+                    appended_content=record['appended_content'],
+                    snapshot_content=record.get('snapshot_content'),
+                )
+                edit.imported_timestamp = _timestamp(record, 'edit_timestamp', line_number)
+                edits.append(edit)
+            if edits:
+                save_edits(edits, self.batch_size)
+                for edit in edits:
+                    edit.edit_timestamp = edit.imported_timestamp
+                NoteEdit.objects.bulk_update(edits, ['edit_timestamp'], batch_size=self.batch_size)
+            self.counts['edits'] += len(edits)
+            self.edits = []
+
+        if self.shares:
+            users = self._users(record.get('user') for line_number, record in self.shares)
+            shares = []
+            for line_number, record in self.shares:
+                note_id = self.note_ids.get(record.get('note'))
+                user_id = users.get(record.get('user'))
+                if note_id is None or user_id is None or user_id == self.owner.id: # unknown note or user, or the owner
+                    self.counts['skipped'] += 1
+                    continue
+                shares.append(NoteShare(note_id=note_id, user_id=user_id))
+                self.shared_user_ids.add(user_id)
+            NoteShare.objects.bulk_create(shares, batch_size=self.batch_size, ignore_conflicts=True)
+            self.counts['shares'] += len(shares)
+            self.shares = []
+
+
+def import_records(owner, records, batch_size=None):
+    """
+    Import (line number, record) pairs as notes owned by owner, in one transaction.
+
+    Edits are attributed to owner, whatever their exported author. Shares keep their users when a
+    user with the same email exists, and are skipped otherwise.
+
+    Returns:
+        - dict with the number of notes, edits and shares imported and of records skipped.
+
+    Raises:
+        - NoteImportError if a record is not valid (nothing is imported then).
+    """
+    importer = _Importer(owner, batch_size or getattr(settings, 'NOTES_BULK_BATCH_SIZE', 1000))
+    with transaction.atomic():
+        for line_number, record in records:
+            importer.add(line_number, record)
+        importer.flush()
+    invalidate_access(owner.id, *importer.shared_user_ids)
+    transaction.on_commit(lambda: publish_shares([owner.id, *importer.shared_user_ids]))
+    return importer.counts
@@ -1,11 +1,28 @@
+from django.conf import settings
 from django.urls import path
 from notes import views
 
+if getattr(settings, 'NOTES_ASYNC_VIEWS', False): # served without a thread per request by ASGI workers
+    from notes import async_views as core_views
+    note_view = core_views.note
+else:
+    core_views = views
+    note_view = views.NoteRetriveUpdate.as_view()
+
 urlpatterns = [
     path('login/', views.login, name='login'),
     path('signup/', views.signup, name='signup'),
-    path('notes/create/', views.create_notes, name='create_notes'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('notes/', core_views.list_notes, name='list_notes'),
+    path('notes/create/', core_views.create_notes, name='create_notes'),
+    path('notes/bulk/', views.create_notes_bulk, name='create_notes_bulk'),
+    path('notes/export/', views.export_notes, name='export_notes'),
+    path('notes/import/', views.import_notes, name='import_notes'),
+    path('notes/changes/', views.note_changes, name='note_changes'),
+    path('notes/events/', views.note_events, name='note_events'),
+    path('notes/search/', views.search_notes, name='search_notes'),
     path('notes/share/', views.share_note, name='share_note'),
-    path('notes/version-history/<str:id>/', views.note_version_history, name='note_version_history'),
-    path('notes/<str:id>/', views.NoteRetriveUpdate.as_view(), name='note'),
-]
\ No newline at end of file
+    path('notes/version-history/<str:id>/', core_views.note_version_history, name='note_version_history'),
+    path('notes/<str:id>/append/', core_views.append_note, name='append_note'),
+    path('notes/<str:id>/', note_view, name='note'),
+]